@@ -0,0 +1,5 @@
+# `python decoder` runs the decoder command line with decoder.py loaded from its cached bytecode,
+# a script given by name is compiled on every run
+from decoder import main
+
+main()
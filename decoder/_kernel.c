@@ -0,0 +1,331 @@
+/*
+ * Compiled decoding kernel, an optional drop-in for the code word loop of `decode` in decoder.py.
+ * Build it with `python build_kernel.py`; without it the pure Python decoder is used.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+#define BITS_IN_BYTE 8
+#define MAX_FIELD_WIDTH 57
+/* layout of the optional counts buffer: literals, references, distances by bit length, then references by length */
+#define COUNT_LITERALS 0
+#define COUNT_REFERENCES 1
+#define COUNT_DISTANCE_BIT_LENGTHS 2
+#define COUNT_LENGTHS (COUNT_DISTANCE_BIT_LENGTHS + MAX_FIELD_WIDTH + 1)
+
+typedef enum {
+    RESULT_OK = 0,
+    RESULT_NO_MEMORY,
+    RESULT_TRUNCATED,
+    RESULT_LENGTH_OUT_OF_RANGE,
+    RESULT_COUNTS_TOO_SMALL,
+} result_t;
+
+typedef struct {
+    const uint8_t *data;
+    Py_ssize_t size; /* bytes */
+    uint64_t position; /* bits */
+} bit_reader_t;
+
+/* Reads `length` (at most MAX_FIELD_WIDTH) big endian bits; the caller checks that they are available. */
+static inline uint64_t read_bits(bit_reader_t *reader, int length)
+{
+    if (length == 0)
+        return 0;
+    Py_ssize_t byte = (Py_ssize_t)(reader->position / BITS_IN_BYTE);
+    int shift = (int)(reader->position % BITS_IN_BYTE);
+    uint64_t word = 0;
+    if (byte + 8 <= reader->size) {
+        for (int i = 0; i < 8; i++)
+            word = (word << BITS_IN_BYTE) | reader->data[byte + i];
+    } else {
+        for (int i = 0; i < 8; i++)
+            word = (word << BITS_IN_BYTE) | (byte + i < reader->size ? reader->data[byte + i] : 0);
+    }
+    reader->position += length;
+    return (word << shift) >> (64 - length);
+}
+
+static inline uint64_t remaining_bits(const bit_reader_t *reader)
+{
+    return (uint64_t)reader->size * BITS_IN_BYTE - reader->position;
+}
+
+/* Raises the error of `BitReader.read` for a field of `length` bits missing from the end of the stream. */
+static void set_truncated_error(const bit_reader_t *reader, uint64_t length)
+{
+    PyErr_Format(PyExc_AssertionError, "Requested bit count exceeds the length of buffer (%llu bits): count %llu",
+                 (unsigned long long)remaining_bits(reader), (unsigned long long)length);
+}
+
+static inline int bit_length(uint64_t value)
+{
+    int length = 0;
+    while (value) {
+        value >>= 1;
+        length++;
+    }
+    return length;
+}
+
+typedef struct {
+    int64_t *data; /* NULL when no counts are collected */
+    Py_ssize_t size;
+} counts_t;
+
+typedef struct {
+    uint8_t *data; /* window history followed by the decoded bytes */
+    Py_ssize_t size;
+    Py_ssize_t capacity;
+} output_t;
+
+static int reserve(output_t *output, Py_ssize_t length)
+{
+    if (output->size + length <= output->capacity)
+        return 1;
+    Py_ssize_t capacity = output->capacity * 2;
+    if (capacity < output->size + length)
+        capacity = output->size + length;
+    uint8_t *data = PyMem_RawRealloc(output->data, (size_t)capacity);
+    if (data == NULL)
+        return 0;
+    output->data = data;
+    output->capacity = capacity;
+    return 1;
+}
+
+typedef struct {
+    Py_ssize_t window_size;
+    int length_width;
+    Py_ssize_t length_bias;
+    int distance_width;
+    int flag_width;
+    int flag_zero_means_literal;
+    int distance_from_end;
+} config_t;
+
+/*
+ * Decodes code words until fewer than `required_bits` remain or `output_limit` bytes have been decoded.
+ * Mirrors `decode_code_words` and `SlidingWindow.copy`: references read the window cyclically, oldest byte after newest.
+ * Fields are checked one at a time, like the reads of `decode_code_words`, so a truncated stream stops at the same field
+ * (`missing_bits` is set to its width). Decoded code words are added to `counts`, if any.
+ */
+static result_t decode_code_words(bit_reader_t *reader, output_t *output, const config_t *config, counts_t *counts,
+                                  uint64_t required_bits, Py_ssize_t output_limit, int64_t *bad_length, uint64_t *missing_bits)
+{
+    const Py_ssize_t window_size = config->window_size;
+    const Py_ssize_t output_end = window_size + output_limit;
+
+    while (remaining_bits(reader) >= required_bits && output->size < output_end) {
+        uint64_t flag = read_bits(reader, config->flag_width);
+        if ((flag == 0) == config->flag_zero_means_literal) {
+            if (remaining_bits(reader) < BITS_IN_BYTE) {
+                *missing_bits = BITS_IN_BYTE;
+                return RESULT_TRUNCATED;
+            }
+            if (!reserve(output, 1))
+                return RESULT_NO_MEMORY;
+            output->data[output->size++] = (uint8_t)read_bits(reader, BITS_IN_BYTE);
+            if (counts->data != NULL)
+                counts->data[COUNT_LITERALS]++;
+            continue;
+        }
+        if (remaining_bits(reader) < (uint64_t)config->distance_width) {
+            *missing_bits = (uint64_t)config->distance_width;
+            return RESULT_TRUNCATED;
+        }
+        int64_t distance = (int64_t)read_bits(reader, config->distance_width);
+        if (remaining_bits(reader) < (uint64_t)config->length_width) {
+            *missing_bits = (uint64_t)config->length_width;
+            return RESULT_TRUNCATED;
+        }
+        int64_t length = (int64_t)read_bits(reader, config->length_width) + config->length_bias;
+        if (length < 0 || length > window_size) {
+            *bad_length = length;
+            return RESULT_LENGTH_OUT_OF_RANGE;
+        }
+        if (counts->data != NULL) {
+            if (COUNT_LENGTHS + length >= counts->size)
+                return RESULT_COUNTS_TOO_SMALL;
+            counts->data[COUNT_REFERENCES]++;
+            counts->data[COUNT_DISTANCE_BIT_LENGTHS + bit_length((uint64_t)distance)]++;
+            counts->data[COUNT_LENGTHS + length]++;
+        }
+        int64_t start = config->distance_from_end ? (int64_t)(window_size - 1) - distance : distance;
+        start %= window_size;
+        if (start < 0)
+            start += window_size;
+        if (!reserve(output, (Py_ssize_t)length))
+            return RESULT_NO_MEMORY;
+        uint8_t *window = output->data + output->size - window_size;
+        uint8_t *tail = output->data + output->size;
+        Py_ssize_t first_part = window_size - (Py_ssize_t)start;
+        if (length <= first_part) {
+            memcpy(tail, window + start, (size_t)length);
+        } else {
+            memcpy(tail, window + start, (size_t)first_part);
+            memcpy(tail + first_part, window, (size_t)(length - first_part));
+        }
+        output->size += (Py_ssize_t)length;
+    }
+    return RESULT_OK;
+}
+
+PyDoc_STRVAR(replay_doc,
+"replay(data, start_bit, window, window_size, length_width, length_bias, distance_width, flag_width,\n"
+"       flag_zero_means_literal, distance_from_end, at_end, output_limit, counts=None) -> (decoded, end_bit, window)\n"
+"\n"
+"Decodes the code words of `data` starting at bit `start_bit`.\n"
+"`window` is the window contents (oldest byte first), or None at the start of the stream.\n"
+"Until `at_end`, only code words of the widest kind are known to be complete; decoding stops\n"
+"after `output_limit` bytes, so a call can be repeated on the same data.\n"
+"`counts` is a writable int64 buffer the decoded code words are added to: literals, references,\n"
+"references by the bit length of their distance (58 entries), then references by their length.");
+
+static PyObject *replay(PyObject *self, PyObject *args)
+{
+    Py_buffer data;
+    Py_ssize_t start_bit;
+    PyObject *window;
+    config_t config;
+    int at_end;
+    Py_ssize_t output_limit;
+    PyObject *counts_object = Py_None;
+    if (!PyArg_ParseTuple(args, "y*nOniniipppn|O", &data, &start_bit, &window, &config.window_size, &config.length_width,
+                          &config.length_bias, &config.distance_width, &config.flag_width,
+                          &config.flag_zero_means_literal, &config.distance_from_end, &at_end, &output_limit, &counts_object))
+        return NULL;
+
+    PyObject *result = NULL;
+    output_t output = {NULL, 0, 0};
+    Py_buffer counts_buffer = {0};
+    counts_t counts = {NULL, 0};
+    bit_reader_t reader = {(const uint8_t *)data.buf, data.len, (uint64_t)start_bit};
+    if (config.window_size < 1 || start_bit < 0 || start_bit > data.len * BITS_IN_BYTE
+        || config.length_width < 0 || config.length_width > MAX_FIELD_WIDTH
+        || config.distance_width < 0 || config.distance_width > MAX_FIELD_WIDTH
+        || config.flag_width < 0 || config.flag_width > MAX_FIELD_WIDTH) {
+        PyErr_SetString(PyExc_ValueError, "Configuration not supported by the compiled kernel");
+        goto done;
+    }
+    if (counts_object != Py_None) {
+        if (PyObject_GetBuffer(counts_object, &counts_buffer, PyBUF_WRITABLE | PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0)
+            goto done;
+        if (counts_buffer.itemsize != sizeof(int64_t) || counts_buffer.format == NULL || strchr("qlL", counts_buffer.format[0]) == NULL
+            || counts_buffer.len / counts_buffer.itemsize <= COUNT_LENGTHS) {
+            PyErr_SetString(PyExc_ValueError, "Counts have to be a writable buffer of int64 values, see the documentation of replay");
+            goto done;
+        }
+        counts.data = (int64_t *)counts_buffer.buf;
+        counts.size = counts_buffer.len / counts_buffer.itemsize;
+    }
+    const uint64_t literal_code_word_width = (uint64_t)config.flag_width + BITS_IN_BYTE;
+    const uint64_t reference_code_word_width = (uint64_t)config.flag_width + config.distance_width + config.length_width;
+    const uint64_t min_code_word_width = literal_code_word_width < reference_code_word_width ? literal_code_word_width : reference_code_word_width;
+    const uint64_t max_code_word_width = literal_code_word_width > reference_code_word_width ? literal_code_word_width : reference_code_word_width;
+
+    output.capacity = config.window_size + (output_limit > 0 ? output_limit : 0) + 1;
+    output.data = PyMem_RawMalloc((size_t)output.capacity);
+    if (output.data == NULL) {
+        PyErr_NoMemory();
+        goto done;
+    }
+
+    if (window == Py_None) {
+        /* the first code word has to be a literal, it also fills the window */
+        if (remaining_bits(&reader) < literal_code_word_width && !at_end) {
+            result = Py_BuildValue("y#nO", "", (Py_ssize_t)0, start_bit, Py_None);
+            goto done;
+        }
+        /* read the way `start_window` does, so a truncated stream fails with the same error */
+        if (remaining_bits(&reader) < (uint64_t)config.flag_width) {
+            set_truncated_error(&reader, (uint64_t)config.flag_width);
+            goto done;
+        }
+        uint64_t flag = read_bits(&reader, config.flag_width);
+        if ((flag == 0) != config.flag_zero_means_literal) {
+            if (config.flag_zero_means_literal)
+                PyErr_Format(PyExc_AssertionError, "First code word not encoding a literal: expected 0, got %llu", (unsigned long long)flag);
+            else
+                PyErr_Format(PyExc_AssertionError, "First code word not encoding a literal: expected non-zero value, got %llu", (unsigned long long)flag);
+            goto done;
+        }
+        if (remaining_bits(&reader) < BITS_IN_BYTE) {
+            set_truncated_error(&reader, BITS_IN_BYTE);
+            goto done;
+        }
+        uint8_t first_character = (uint8_t)read_bits(&reader, BITS_IN_BYTE);
+        memset(output.data, first_character, (size_t)config.window_size);
+        output.data[config.window_size] = first_character;
+        output.size = config.window_size + 1;
+        if (counts.data != NULL)
+            counts.data[COUNT_LITERALS]++;
+    } else {
+        Py_buffer contents;
+        if (PyObject_GetBuffer(window, &contents, PyBUF_SIMPLE) < 0)
+            goto done;
+        if (contents.len != config.window_size) {
+            PyErr_Format(PyExc_ValueError, "Window contents have %zd bytes, expected %zd", contents.len, config.window_size);
+            PyBuffer_Release(&contents);
+            goto done;
+        }
+        memcpy(output.data, contents.buf, (size_t)config.window_size);
+        PyBuffer_Release(&contents);
+        output.size = config.window_size;
+    }
+
+    result_t status;
+    int64_t bad_length = 0;
+    uint64_t missing_bits = 0;
+    Py_BEGIN_ALLOW_THREADS
+    status = decode_code_words(&reader, &output, &config, &counts, at_end ? min_code_word_width : max_code_word_width,
+                               output_limit > 0 ? output_limit : PY_SSIZE_T_MAX - config.window_size, &bad_length, &missing_bits);
+    Py_END_ALLOW_THREADS
+
+    switch (status) {
+    case RESULT_OK:
+        result = Py_BuildValue("(y#ny#)", output.data + config.window_size, output.size - config.window_size,
+                               (Py_ssize_t)reader.position, output.data + output.size - config.window_size, config.window_size);
+        break;
+    case RESULT_NO_MEMORY:
+        PyErr_NoMemory();
+        break;
+    case RESULT_TRUNCATED:
+        set_truncated_error(&reader, missing_bits);
+        break;
+    case RESULT_LENGTH_OUT_OF_RANGE:
+        PyErr_Format(PyExc_AssertionError, "Requested refererence length exceeds the size of dictionary (%zd): %lld",
+                     config.window_size, (long long)bad_length);
+        break;
+    case RESULT_COUNTS_TOO_SMALL:
+        PyErr_Format(PyExc_ValueError, "Counts have %zd entries, too few for the reference lengths", counts.size);
+        break;
+    }
+
+done:
+    if (counts_buffer.obj != NULL)
+        PyBuffer_Release(&counts_buffer);
+    PyMem_RawFree(output.data);
+    PyBuffer_Release(&data);
+    return result;
+}
+
+static PyMethodDef kernel_methods[] = {
+    {"replay", replay, METH_VARARGS, replay_doc},
+    {NULL, NULL, 0, NULL},
+};
+
+static struct PyModuleDef kernel_module = {
+    PyModuleDef_HEAD_INIT,
+    "_kernel",
+    "Compiled LZSS decoding kernel.",
+    -1,
+    kernel_methods,
+};
+
+PyMODINIT_FUNC PyInit__kernel(void)
+{
+    return PyModule_Create(&kernel_module);
+}
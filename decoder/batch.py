@@ -0,0 +1,146 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, fields
+import glob
+import json
+import os
+import time
+from typing import TextIO
+
+from container import decode_container, is_container
+from decoder import LzssConfig, decode
+
+DEFAULT_SUFFIX = '.lzss'
+DECODED_SUFFIX = '.out'
+TASKS_PER_WORKER = 4
+
+
+@dataclass
+class BatchTask:
+    input_path: str
+    output_path: str
+    config: LzssConfig  # ignored for framed containers, which record their own
+    container: bool | None = None  # framed container or raw stream, None detects it from the header
+
+
+@dataclass
+class BatchResult:
+    input_path: str
+    output_path: str
+    input_bytes: int = 0
+    output_bytes: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+
+
+def decoded_name(path: str, suffix: str = DEFAULT_SUFFIX) -> str:
+    '''
+    :return: `path` without `suffix`, or with `DECODED_SUFFIX` appended when it does not end with `suffix`.
+    '''
+    return path[:-len(suffix)] if suffix and path.endswith(suffix) else path + DECODED_SUFFIX
+
+
+def collect_tasks(paths: list[str], config: LzssConfig, output_dir: str | None = None, suffix: str = DEFAULT_SUFFIX, container: bool | None = None) -> list[BatchTask]:
+    '''
+    Expands directories (recursively, files ending with `suffix`) and glob patterns into decoding tasks.
+    Files found in a directory keep their layout relative to that directory under `output_dir`;
+    files given directly or through a pattern are placed in `output_dir` by name.
+    Without `output_dir`, every output is written next to its input.
+    :param paths: Files, directories or glob patterns (`**` matches subdirectories).
+    :param config: Decoder configuration for raw streams.
+    :param container: Whether the files are framed containers; None detects it per file.
+    :return: Tasks in a stable order, without duplicates.
+    '''
+    found = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(suffix):
+                        input_path = os.path.join(root, name)
+                        found.setdefault(input_path, os.path.relpath(input_path, path))
+        else:
+            matches = sorted(glob.glob(path, recursive=True)) if glob.has_magic(path) else [path]
+            for input_path in matches:
+                if os.path.isfile(input_path) or not glob.has_magic(path):
+                    found.setdefault(input_path, os.path.basename(input_path))
+    tasks = []
+    for input_path, relative_path in found.items():
+        output_path = os.path.join(output_dir, relative_path) if output_dir is not None else input_path
+        tasks.append(BatchTask(input_path, decoded_name(output_path, suffix), LzssConfig(**vars(config)), container))
+    return tasks
+
+
+def read_manifest(manifest_file: TextIO, config: LzssConfig, container: bool | None = None) -> list[BatchTask]:
+    '''
+    Reads decoding tasks from JSON lines: `{"input": ..., "output": ..., "window_size": ...}`.
+    Any `LzssConfig` field may be given per entry; missing fields are taken from `config`.
+    `"container": true` or `false` sets the format of an entry, which is otherwise `container` (None detects it).
+    Blank lines and lines starting with `#` are skipped.
+    '''
+    config_fields = {field.name for field in fields(LzssConfig)}
+    tasks = []
+    for line_number, line in enumerate(manifest_file, 1):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        entry = json.loads(line)
+        assert 'input' in entry and 'output' in entry, f'Manifest line {line_number}: entries need "input" and "output"'
+        unknown = set(entry) - config_fields - {'input', 'output', 'container'}
+        assert not unknown, f'Manifest line {line_number}: unknown fields {sorted(unknown)}'
+        task_config = LzssConfig(**{**vars(config), **{name: entry[name] for name in config_fields & set(entry)}})
+        tasks.append(BatchTask(entry['input'], entry['output'], task_config, entry.get('container', container)))
+    return tasks
+
+
+def decode_file(task: BatchTask) -> BatchResult:
+    '''
+    Decodes one file, recording a failure in the result instead of raising it.
+    A partially written output is removed.
+    '''
+    result = BatchResult(task.input_path, task.output_path)
+    start = time.perf_counter()
+    try:
+        with open(task.input_path, 'rb') as input_file:
+            output_dir = os.path.dirname(task.output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            with open(task.output_path, 'wb') as output_file:
+                try:
+                    if task.container if task.container is not None else is_container(input_file):
+                        decode_container(input_file, output_file)
+                    else:
+                        decode(input_file, output_file, task.config)
+                except BaseException:
+                    output_file.close()
+                    os.remove(task.output_path)
+                    raise
+                result.input_bytes = input_file.tell()
+                result.output_bytes = output_file.tell()
+    except Exception as error:
+        result.error = f'{type(error).__name__}: {error}'
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def decode_batch(tasks: list[BatchTask], jobs: int = 1, threads: bool = False) -> list[BatchResult]:
+    '''
+    Decodes every task, keeping at most `jobs` files in progress.
+    The pool is created once for the whole batch; tasks are handed to worker processes in chunks,
+    so small files do not pay a round trip each.
+    :param jobs: Number of workers; 1 decodes in the current process.
+    :param threads: Use a thread pool instead of a process pool.
+    :return: Results, in the order of `tasks`.
+    '''
+    if jobs <= 1:
+        return list(map(decode_file, tasks))
+    with (ThreadPoolExecutor(jobs) if threads else ProcessPoolExecutor(jobs)) as executor:
+        chunk_size = 1 if threads else max(1, len(tasks) // (jobs * TASKS_PER_WORKER))
+        return list(executor.map(decode_file, tasks, chunksize=chunk_size))
+
+
+def summary(results: list[BatchResult], seconds: float) -> str:
+    failed = sum(result.error is not None for result in results)
+    input_bytes = sum(result.input_bytes for result in results)
+    output_bytes = sum(result.output_bytes for result in results)
+    return (
+        f'Decoded {len(results) - failed} of {len(results)} files ({failed} failed): {input_bytes} bytes into {output_bytes} bytes '
+        f'in {seconds:.3f} s ({output_bytes / max(seconds, 1e-9) / 1e6:.2f} MB/s, {len(results) / max(seconds, 1e-9):.1f} files/s)')
@@ -0,0 +1,176 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import decoder
+from encoder import encode
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+EXAMPLES_DIR = os.path.join(os.path.dirname(__file__), 'examples')
+# examples/ were encoded with https://github.com/MichaelDipperstein/lzss defaults, each decodes to its own name
+EXAMPLES_CONFIG = decoder.LzssConfig(4096, 4, 3, flag_zero_means_literal=False)
+CORPORA = ['img', 'txt', 'random']
+MIN_WIDTH = 4
+MAX_WIDTH = 16
+
+
+def grid(distance_widths: list[int], length_widths: list[int] | None) -> list[tuple[int, int]]:
+    '''
+    Builds the same (distance width, length width) grid as `run_multiple_tests.sh`: length widths up to the distance width.
+    '''
+    return [
+        (distance_width, length_width)
+        for distance_width in distance_widths
+        for length_width in (length_widths if length_widths is not None else range(MIN_WIDTH, distance_width + 1))
+    ]
+
+
+def corpus_files(corpora: list[str]) -> list[str]:
+    files = []
+    for corpus in corpora:
+        for root, _, names in os.walk(os.path.join(DATA_DIR, corpus)):
+            files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith('.pgm'))
+    return files
+
+
+def encoded_stream(source: str, distance_width: int, length_width: int, work_dir: str, encoder_path: str | None) -> bytes:
+    '''
+    Encodes `source` with the given widths, reusing a previously encoded stream from `work_dir`.
+    :param encoder_path: Rust encoder binary; the Python encoder is used when not given.
+    '''
+    target = os.path.join(work_dir, f'd{distance_width}-l{length_width}', os.path.relpath(source, DATA_DIR) + '.lzss')
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if encoder_path is not None:
+            subprocess.run([encoder_path, '-d', str(distance_width), '-m', str(length_width), source, target], check=True, stdout=subprocess.DEVNULL)
+        else:
+            with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+                target_file.write(encode(source_file.read(), decoder.LzssConfig(2 ** distance_width, length_width, 0)))
+    with open(target, 'rb') as target_file:
+        return target_file.read()
+
+
+def count_tokens(stream: bytes, config: decoder.LzssConfig) -> int:
+    kinds, _, _, _ = decoder.parse_tokens(np.unpackbits(np.frombuffer(stream, dtype=np.uint8)), 0, config)
+    return len(kinds)
+
+
+def check_examples(decode) -> list[str]:
+    '''
+    Decodes every stream in `examples/` with `decode`.
+    :return: Names of the examples that did not decode to their expected contents.
+    '''
+    different = []
+    for name in sorted(os.listdir(EXAMPLES_DIR)):
+        if name.endswith('.lzss'):
+            output_file = io.BytesIO()
+            with open(os.path.join(EXAMPLES_DIR, name), 'rb') as input_file:
+                decode(input_file, output_file, decoder.LzssConfig(**vars(EXAMPLES_CONFIG)))
+            if output_file.getvalue() != name[:-len('.lzss')].encode():
+                different.append(name)
+    return different
+
+
+def run_case(source: str, distance_width: int, length_width: int, args: argparse.Namespace) -> dict:
+    '''
+    Decodes one encoded file `args.repeat` times and once more under tracemalloc.
+    :return: Result record (times in seconds, sizes in bytes).
+    '''
+    with open(source, 'rb') as source_file:
+        original = source_file.read()
+    stream = encoded_stream(source, distance_width, length_width, args.work_dir, args.encoder)
+    decode = getattr(decoder, args.decoder)
+    make_config = lambda: decoder.LzssConfig(2 ** distance_width, length_width, 0)
+
+    best_time = float('inf')
+    for _ in range(args.repeat):
+        output_file = io.BytesIO()
+        start = time.perf_counter()
+        decode(io.BytesIO(stream), output_file, make_config())
+        best_time = min(best_time, time.perf_counter() - start)
+    identical = output_file.getvalue() == original
+
+    tracemalloc.start()
+    decode(io.BytesIO(stream), io.BytesIO(), make_config())
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    token_count = count_tokens(stream, make_config())
+    return {
+        'file': os.path.relpath(source, DATA_DIR),
+        'distance_width': distance_width,
+        'length_width': length_width,
+        'original_size': len(original),
+        'encoded_size': len(stream),
+        'compression_ratio': len(stream) / len(original),
+        'tokens': token_count,
+        'seconds': best_time,
+        'mb_per_second': len(original) / best_time / 1e6,
+        'ns_per_token': best_time / max(token_count, 1) * 1e9,
+        'peak_memory': peak_memory,
+        'identical': identical,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict]) -> None:
+    '''
+    Prints the decoding speed of every case relative to a previous run.
+    '''
+    key = lambda result: (result['file'], result['distance_width'], result['length_width'])
+    previous = {key(result): result for result in baseline}
+    speedups = []
+    for result in results:
+        if key(result) in previous:
+            speedup = previous[key(result)]['seconds'] / result['seconds']
+            speedups.append(speedup)
+            print(f'{result["file"]:<32} d{result["distance_width"]:<2} l{result["length_width"]:<2} {speedup:6.2f}x')
+    if speedups:
+        print(f'Geometric mean speedup over {len(speedups)} cases: {float(np.exp(np.mean(np.log(speedups)))):.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LZSS decoder benchmark over the data/ corpora')
+    parser.add_argument('--corpora', nargs='+', default=CORPORA, choices=CORPORA, help='Corpora (subdirectories of data/) to run on')
+    parser.add_argument('--distance-widths', type=int, nargs='+', default=list(range(MIN_WIDTH, MAX_WIDTH + 1)), help='Distance widths (in bits)')
+    parser.add_argument('--length-widths', type=int, nargs='+', default=None, help='Length widths (in bits); default is every width from 4 up to the distance width')
+    parser.add_argument('--decoder', choices=['decode', 'decode_python', 'decode_bulk'], default='decode', help='Decoder entry point to measure; decode uses the compiled kernel when it is built')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case, the fastest one is reported')
+    parser.add_argument('--encoder', default=None, help='Rust encoder binary (e.g. target/release/encoder); the Python encoder is used by default')
+    parser.add_argument('--work-dir', default=os.path.join(os.path.dirname(__file__), '..', 'test', 'benchmark'), help='Directory for encoded files, reused between runs')
+    parser.add_argument('--label', default=None, help='Name of the measured decoder version, stored in the JSON output')
+    parser.add_argument('--json', type=argparse.FileType('w'), default=None, help='Write results as JSON')
+    parser.add_argument('--compare', type=argparse.FileType('r'), default=None, help='JSON output of a previous run to compare against')
+    args = parser.parse_args()
+
+    different_examples = check_examples(getattr(decoder, args.decoder))
+    print(f'{args.decoder} (compiled kernel {"in use" if decoder.kernel_supports(EXAMPLES_CONFIG) else "not available"}), examples: {", ".join(different_examples) or "all identical"}')
+    results = []
+    files = corpus_files(args.corpora)
+    for distance_width, length_width in grid(args.distance_widths, args.length_widths):
+        print(f'[{distance_width}-bit distance and {length_width}-bit length]')
+        for source in files:
+            result = run_case(source, distance_width, length_width, args)
+            results.append(result)
+            print(
+                f'  {result["file"]:<32} ratio {result["compression_ratio"]:6.3f}  {result["mb_per_second"]:7.2f} MB/s  '
+                f'{result["ns_per_token"]:7.0f} ns/token  peak {result["peak_memory"] / 1024:8.0f} KiB  '
+                f'{"identical" if result["identical"] else "DIFFERENT"}')
+
+    total_seconds = sum(result['seconds'] for result in results)
+    total_bytes = sum(result['original_size'] for result in results)
+    print(f'Decoded {total_bytes} bytes in {total_seconds:.3f} s ({total_bytes / total_seconds / 1e6:.2f} MB/s)')
+    if args.json is not None:
+        json.dump({'label': args.label, 'decoder': args.decoder, 'python': platform.python_version(), 'results': results}, args.json, indent=2)
+    if args.compare is not None:
+        compare(results, json.load(args.compare)['results'])
+    different = [result for result in results if not result['identical']]
+    if different or different_examples:
+        sys.exit(f'{len(different) + len(different_examples)} decoded files differ from the originals')
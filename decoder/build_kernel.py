@@ -0,0 +1,12 @@
+import os
+
+from setuptools import Extension, setup
+
+if __name__ == '__main__':
+    # builds _kernel next to decoder.py, which picks it up automatically
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    setup(
+        name='lzss-kernel',
+        ext_modules=[Extension('_kernel', ['_kernel.c'], extra_compile_args=['-O3'] if os.name != 'nt' else [])],
+        script_args=['build_ext', '--inplace'],
+    )
@@ -0,0 +1,301 @@
+from collections import deque
+from dataclasses import dataclass
+import io
+import os
+import struct
+import sys
+from typing import TYPE_CHECKING, BinaryIO, Iterable
+import zlib
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+from decoder import CONTAINER_MAGIC, LzssConfig, LzssDecoder, add_config_arguments, code_word_widths, config_from_args, decode_buffer, peek
+
+MAGIC = CONTAINER_MAGIC
+VERSION = 2
+VERSION_WITHOUT_CHECKSUMS = 1
+CONFIG_FORMAT = '>IBiBBB'
+CONFIG_SIZE = struct.calcsize(CONFIG_FORMAT)
+HEADER_FORMAT = '>4sB' + CONFIG_FORMAT[1:] + 'I'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# follows the header when OPTION_PRESET_DICTIONARY is set
+DICTIONARY_ID_FORMAT = '>I'
+DICTIONARY_ID_SIZE = struct.calcsize(DICTIONARY_ID_FORMAT)
+# compressed size, decoded size and, from version 2, CRC32 of the compressed and of the decoded block
+BLOCK_INDEX_FORMATS = {VERSION_WITHOUT_CHECKSUMS: '>II', VERSION: '>IIII'}
+
+OPTION_FLAG_ZERO_MEANS_LITERAL = 0x01
+OPTION_DISTANCE_FROM_END = 0x02
+OPTION_PRESET_DICTIONARY = 0x04
+KNOWN_OPTIONS = OPTION_FLAG_ZERO_MEANS_LITERAL | OPTION_DISTANCE_FROM_END | OPTION_PRESET_DICTIONARY
+
+
+@dataclass
+class ContainerBlock:
+    offset: int  # bytes, from the start of the container
+    compressed_size: int  # bytes
+    decoded_size: int  # bytes
+    payload_checksum: int | None = None  # CRC32 of the compressed block
+    decoded_checksum: int | None = None  # CRC32 of the decoded block
+
+
+class CorruptBlockError(ValueError):
+    '''
+    A container block does not match its index entry: it is truncated, or its size or checksum differs.
+    Raised whatever the interpreter's optimization level, unlike the assertions guarding the stream format.
+    '''
+    def __init__(self, offset: int, message: str):
+        # both arguments are kept, so the error survives pickling back from a worker process
+        super().__init__(offset, message)
+        self.offset = offset  # bytes, from the start of the container
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.message
+
+
+class ChecksumWriter:
+    '''
+    Output file wrapper computing the CRC32 and the size of everything written through it.
+    '''
+    def __init__(self, output_file: BinaryIO):
+        self._output_file = output_file
+        self.checksum = 0
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.checksum = zlib.crc32(data, self.checksum)
+        self.size += len(data)
+        return self._output_file.write(data)
+
+
+def is_container_header(header: bytes) -> bool:
+    '''
+    Checks whether a stream starting with `header` is a framed container.
+    Any 32 bits can start a raw stream, the magic included, so the rest of the header has to be valid as well:
+    a supported version and a configuration `pack_config` can produce.
+    :param header: First bytes of the stream, at least `HEADER_SIZE` of them for a container.
+    :return: True for framed containers, false for raw streams.
+    '''
+    if len(header) < HEADER_SIZE:
+        return False
+    magic, version, window_size, _, _, distance_width, flag_width, options, _ = struct.unpack(HEADER_FORMAT, header[:HEADER_SIZE])
+    return magic == MAGIC and version in BLOCK_INDEX_FORMATS and window_size > 0 and distance_width > 0 and flag_width > 0 \
+        and not options & ~KNOWN_OPTIONS
+
+
+def is_container(input_file: BinaryIO) -> bool:
+    '''
+    Checks whether `input_file` is a framed container (see `is_container_header`), without consuming any input.
+    :param input_file: Buffered or seekable source.
+    :return: True for framed containers, false for raw streams.
+    '''
+    return is_container_header(peek(input_file, HEADER_SIZE))
+
+
+def pack_config(config: LzssConfig) -> tuple[int, int, int, int, int, int]:
+    '''
+    Converts `config` into the fields of `CONFIG_FORMAT`, resolving the automatic distance width (in place, see `code_word_widths`).
+    '''
+    code_word_widths(config)
+    options = (OPTION_FLAG_ZERO_MEANS_LITERAL if config.flag_zero_means_literal else 0) \
+        | (OPTION_DISTANCE_FROM_END if config.distance_from_end else 0) \
+        | (OPTION_PRESET_DICTIONARY if config.dictionary_id else 0)
+    return config.window_size, config.length_width, config.length_bias, config.distance_width, config.flag_width, options
+
+
+def unpack_config(window_size: int, length_width: int, length_bias: int, distance_width: int, flag_width: int, options: int) -> LzssConfig:
+    return LzssConfig(
+        window_size, length_width, length_bias, distance_width, flag_width,
+        bool(options & OPTION_FLAG_ZERO_MEANS_LITERAL), bool(options & OPTION_DISTANCE_FROM_END))
+
+
+def write_container(output_file: BinaryIO, config: LzssConfig, blocks: list[tuple[bytes, int, int]], checksums: bool = True) -> int:
+    '''
+    Writes a framed container: header, block index and independently decodable blocks.
+    Every block has to be a complete raw stream, starting with a literal and an empty window, or with the window preloaded from the preset dictionary.
+    :param output_file: Target.
+    :param config: Configuration every block was encoded with; its preset dictionary is recorded by ID.
+    :param blocks: Triples of (encoded block, decoded size in bytes, CRC32 of the decoded block).
+    :param checksums: Record CRC32 checksums of every block; without them the container is written in version 1.
+    :return: Number of bytes written.
+    '''
+    version = VERSION if checksums else VERSION_WITHOUT_CHECKSUMS
+    written = output_file.write(struct.pack(HEADER_FORMAT, MAGIC, version, *pack_config(config), len(blocks)))
+    if config.dictionary_id:
+        written += output_file.write(struct.pack(DICTIONARY_ID_FORMAT, config.dictionary_id))
+    for payload, decoded_size, decoded_checksum in blocks:
+        fields = (len(payload), decoded_size, zlib.crc32(payload), decoded_checksum) if checksums else (len(payload), decoded_size)
+        written += output_file.write(struct.pack(BLOCK_INDEX_FORMATS[version], *fields))
+    for payload, _, _ in blocks:
+        written += output_file.write(payload)
+    return written
+
+
+def read_header(input_file: BinaryIO) -> tuple[LzssConfig, list[ContainerBlock]]:
+    '''
+    Reads the container header and block index, leaving `input_file` at the first block.
+    :param input_file: Source, positioned at the start of the container.
+    :return: Decoder configuration and the block index.
+    '''
+    header = input_file.read(HEADER_SIZE)
+    assert len(header) == HEADER_SIZE, f'Container header truncated: expected {HEADER_SIZE} bytes, got {len(header)}'
+    magic, version, *config_fields, block_count = struct.unpack(HEADER_FORMAT, header)
+    assert magic == MAGIC, f'Not a framed container: expected magic {MAGIC}, got {magic}'
+    assert version in BLOCK_INDEX_FORMATS, f'Unsupported container version: expected one of {sorted(BLOCK_INDEX_FORMATS)}, got {version}'
+    config = unpack_config(*config_fields)
+    header_size = HEADER_SIZE
+    if config_fields[-1] & OPTION_PRESET_DICTIONARY:
+        dictionary_id = input_file.read(DICTIONARY_ID_SIZE)
+        assert len(dictionary_id) == DICTIONARY_ID_SIZE, 'Container header truncated: dictionary ID missing'
+        config.dictionary_id, = struct.unpack(DICTIONARY_ID_FORMAT, dictionary_id)
+        header_size += DICTIONARY_ID_SIZE
+
+    block_index_size = struct.calcsize(BLOCK_INDEX_FORMATS[version])
+    index = input_file.read(block_index_size * block_count)
+    assert len(index) == block_index_size * block_count, f'Block index truncated: expected {block_count} entries'
+    blocks = []
+    offset = header_size + len(index)
+    for compressed_size, decoded_size, *checksums in struct.iter_unpack(BLOCK_INDEX_FORMATS[version], index):
+        blocks.append(ContainerBlock(offset, compressed_size, decoded_size, *checksums))
+        offset += compressed_size
+    return config, blocks
+
+
+def check_payload(block: ContainerBlock, payload: bytes | memoryview):
+    '''
+    Checks a compressed block against its index entry, before any time is spent decoding it.
+    :raises CorruptBlockError: The block is truncated or its checksum differs.
+    '''
+    if len(payload) != block.compressed_size:
+        raise CorruptBlockError(block.offset, f'Block at offset {block.offset} truncated: expected {block.compressed_size} bytes, got {len(payload)}')
+    if block.payload_checksum is not None:
+        checksum = zlib.crc32(payload)
+        if checksum != block.payload_checksum:
+            raise CorruptBlockError(block.offset, f'Block at offset {block.offset} corrupted: expected CRC32 {block.payload_checksum:08x}, got {checksum:08x}')
+
+
+def check_decoded(block: ContainerBlock, decoded_size: int, decoded_checksum: int):
+    '''
+    :raises CorruptBlockError: The decoded size or checksum of the block differs from its index entry.
+    '''
+    if decoded_size != block.decoded_size:
+        raise CorruptBlockError(block.offset, f'Decoded block size mismatch at offset {block.offset}: expected {block.decoded_size} bytes, got {decoded_size}')
+    if block.decoded_checksum is not None and decoded_checksum != block.decoded_checksum:
+        raise CorruptBlockError(block.offset, f'Decoded block at offset {block.offset} corrupted: expected CRC32 {block.decoded_checksum:08x}, got {decoded_checksum:08x}')
+
+
+def decode_block(payload: bytes, config: LzssConfig, block: ContainerBlock) -> bytes:
+    '''
+    Decodes a single container block. Blocks share no state, so this can run in any process.
+    :param payload: Encoded block.
+    :param config: Container configuration.
+    :param block: Index entry of the block, its decoded size and checksum are verified.
+    :return: Decoded block.
+    '''
+    output = io.BytesIO()
+    decode_buffer(payload, output, config)
+    decoded = output.getvalue()
+    check_decoded(block, len(decoded), zlib.crc32(decoded) if block.decoded_checksum is not None else 0)
+    return decoded
+
+
+def read_blocks(input_file: BinaryIO, blocks: list[ContainerBlock]) -> Iterable[bytes]:
+    '''
+    Reads consecutive blocks, checking every one against its index entry.
+    '''
+    for block in blocks:
+        payload = input_file.read(block.compressed_size)
+        check_payload(block, payload)
+        yield payload
+
+
+def decode_container(input_file: BinaryIO, output_file: BinaryIO, workers: int = 1) -> int:
+    '''
+    Decodes a framed container, optionally spreading blocks across `workers` processes.
+    Blocks are always written in order; at most two blocks per worker are in flight at once.
+    :param input_file: Source, positioned at the start of the container.
+    :param output_file: Target.
+    :param workers: Number of worker processes; 1 decodes in the current process.
+    :return: Number of bytes written.
+    '''
+    config, blocks = read_header(input_file)
+    written = 0
+    if workers <= 1:
+        for block, payload in zip(blocks, read_blocks(input_file, blocks)):
+            written += output_file.write(decode_block(payload, config, block))
+        return written
+
+    # process pools are slow to import, single worker decoding (the common case for small files) does without
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as executor:
+        written += _decode_in_order(executor, input_file, output_file, config, blocks, 2 * workers)
+    return written
+
+
+def _decode_in_order(executor: 'Executor', input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig, blocks: list[ContainerBlock], max_pending: int) -> int:
+    written = 0
+    pending = deque()
+    for block, payload in zip(blocks, read_blocks(input_file, blocks)):
+        if len(pending) >= max_pending:
+            written += output_file.write(pending.popleft().result())
+        pending.append(executor.submit(decode_block, payload, config, block))
+    while pending:
+        written += output_file.write(pending.popleft().result())
+    return written
+
+
+def verify_container(input_file: BinaryIO, workers: int = 1) -> int:
+    '''
+    Decodes a framed container without writing the output, checking the size and checksums of every block.
+    Seekable inputs have all compressed blocks checked first, so a corrupt block is reported before anything is decoded.
+    :raises CorruptBlockError: A block failed its size or checksum check.
+    :return: Number of bytes decoded.
+    '''
+    if input_file.seekable():
+        start = input_file.tell()
+        _, blocks = read_header(input_file)
+        for _ in read_blocks(input_file, blocks):
+            pass
+        input_file.seek(start)
+    with open(os.devnull, 'wb') as null_file:
+        return decode_container(input_file, null_file, workers)
+
+
+def wrap_raw(input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig, checksums: bool = True) -> int:
+    '''
+    Wraps an existing raw stream into a single block container, recording its configuration in the header.
+    :return: Number of bytes written.
+    '''
+    payload = input_file.read()
+    decoder = LzssDecoder(config)
+    decoded = decoder.feed(payload) + decoder.flush()
+    return write_container(output_file, config, [(payload, len(decoded), zlib.crc32(decoded))], checksums)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='LZSS framed container tool')
+    parser.add_argument('command', choices=['wrap', 'info', 'verify'], help='wrap: store a raw stream in a single block container, info: print the container header, verify: check every block')
+    parser.add_argument('input_file', type=argparse.FileType('rb'), help='Input file')
+    parser.add_argument('output_file', type=argparse.FileType('wb'), nargs='?', help='Output file (for wrap)')
+    add_config_arguments(parser)
+    parser.add_argument('--no-checksums', action='store_true', help='Write a version 1 container, without block checksums (for wrap)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes (for verify)')
+    args = parser.parse_args()
+
+    if args.command == 'wrap':
+        output_file = args.output_file if args.output_file is not None else sys.stdout.buffer
+        wrap_raw(args.input_file, output_file, config_from_args(args), not args.no_checksums)
+    elif args.command == 'verify':
+        try:
+            decoded_size = verify_container(args.input_file, args.workers)
+        except (CorruptBlockError, AssertionError) as error:
+            sys.exit(f'FAILED: {error}')
+        print(f'OK: {decoded_size} bytes decoded', file=sys.stderr)
+    else:
+        config, blocks = read_header(args.input_file)
+        print(config)
+        print(f'{len(blocks)} blocks, {sum(block.compressed_size for block in blocks)} bytes encoded, {sum(block.decoded_size for block in blocks)} bytes decoded, '
+              f'{"with" if blocks and blocks[0].payload_checksum is not None else "without"} checksums')
@@ -1,13 +1,34 @@
-import argparse
-from dataclasses import dataclass
-from math import ceil, floor, log2, sqrt
+from dataclasses import asdict, dataclass, field
+from math import ceil, log2, sqrt
+import os
 import sys
-from typing import BinaryIO
+import time
+from typing import TYPE_CHECKING, AsyncIterator, BinaryIO, Callable, Iterable, Iterator, TextIO
+
+# the plain decoding path needs none of these: NumPy is imported by the bulk and metrics decoders, argparse by the command line
+if TYPE_CHECKING:
+    import argparse
+    import asyncio
+
+    import numpy as np
+
+try:
+    # optional compiled kernel, built with build_kernel.py
+    import _kernel
+except ImportError:
+    _kernel = None
+if os.environ.get('LZSS_NO_KERNEL'):
+    _kernel = None
 
 BITS_IN_BYTE = 8
 MIN_BYTE_VALUE = 0x00
 MAX_BYTE_VALUE = 0xFF
 BYTES_TO_READ_AT_ONCE = 4096
+BYTES_TO_PARSE_AT_ONCE = 65536
+KERNEL_OUTPUT_LIMIT = 1 << 20
+KERNEL_MAX_FIELD_WIDTH = 57
+# first bytes of framed containers (see container.py), checked here so that raw streams are decoded without importing it
+CONTAINER_MAGIC = b'LZSF'
 
 
 @dataclass
@@ -20,40 +41,75 @@ class LzssConfig:
     flag_width: int = 1  # bits
     flag_zero_means_literal: bool = True
     distance_from_end: bool = False
+    dictionary_id: int = 0  # preset dictionary (see dictionary.py), 0 means none
+
+
+def code_word_widths(config: LzssConfig) -> tuple[int, int, int, int]:
+    '''
+    Resolves the automatic distance width of `config` in place.
+    :return: Widths (in bits) of the shortest and of the longest code word, of a literal and of a reference code word.
+    '''
+    if config.distance_width < 1:
+        config.distance_width = ceil(log2(config.window_size))
+    literal_code_word_width = config.flag_width + BITS_IN_BYTE
+    reference_code_word_width = config.flag_width + config.length_width + config.distance_width
+    return min(literal_code_word_width, reference_code_word_width), max(literal_code_word_width, reference_code_word_width), \
+        literal_code_word_width, reference_code_word_width
+
 
+class BitReader:
+    '''
+    Big endian bit reader over a stream of bytes.
+    Bits are moved from the byte buffer into an integer accumulator in whole words,
+    so code word fields are extracted with a shift and a mask instead of slicing the buffer.
+    '''
+    REFILL_BYTES = 8
+
+    def __init__(self, initial: bytes | memoryview = b''):
+        # a memoryview (e.g. of a memory-mapped file) is read in place, without copying
+        self._buffer = initial
+        self._position = 0
+        self._accumulator = 0
+        self._accumulator_bits = 0
+        self._total_bytes_added = len(initial)
+        self._refills = 0
 
-class BitBuffer:
-    def __init__(self):
-        self._buffer = b''
-        self._offset = 0
-        self._remaining_bits = 0
-        self._total_bytes_added = 0
-        self._total_bytes_removed = 0
-    
-    def add_offset(self, offset: int):
-        self._offset += offset
-        self._remaining_bits -= offset
-        removed_byte_count = floor(self._offset / BITS_IN_BYTE)
-        self._buffer = self._buffer[removed_byte_count:]
-        self._offset -= removed_byte_count * BITS_IN_BYTE
-        self._total_bytes_removed += removed_byte_count
-    
     def add_bytes(self, b: bytes):
-        self._buffer += b
-        self._remaining_bits += len(b) * BITS_IN_BYTE
+        # consumed bytes are dropped once per refill rather than once per code word
+        self._buffer = self._buffer[self._position:] + b
+        self._position = 0
         self._total_bytes_added += len(b)
 
-    @property
-    def buffer(self):
-        return self._buffer
+    def read(self, length: int) -> int:
+        '''
+        Reads `length` bits from the buffer and converts them to an unsigned integer.
+        :param length: Length in bits.
+        :return: Unsigned integer in range [0; 2^`length`)
+        '''
+        if self._accumulator_bits < length:
+            self._refill(length)
+        self._accumulator_bits -= length
+        value = self._accumulator >> self._accumulator_bits
+        self._accumulator &= (1 << self._accumulator_bits) - 1
+        return value
+
+    def _refill(self, length: int):
+        self._refills += 1
+        buffer = self._buffer
+        while self._accumulator_bits < length and self._position < len(buffer):
+            chunk = buffer[self._position:(self._position + self.REFILL_BYTES)]
+            self._position += len(chunk)
+            self._accumulator = (self._accumulator << (len(chunk) * BITS_IN_BYTE)) | int.from_bytes(chunk, 'big')
+            self._accumulator_bits += len(chunk) * BITS_IN_BYTE
+        assert self._accumulator_bits >= length, f'Requested bit count exceeds the length of buffer ({self.remaining_bits} bits): count {length}'
 
     @property
     def offset(self):
-        return self._offset
+        return (self._total_bytes_added * BITS_IN_BYTE - self.remaining_bits) % BITS_IN_BYTE
 
     @property
     def remaining_bits(self):
-        return self._remaining_bits
+        return self._accumulator_bits + (len(self._buffer) - self._position) * BITS_IN_BYTE
 
     @property
     def total_bytes_added(self):
@@ -61,119 +117,175 @@ class BitBuffer:
 
     @property
     def total_bytes_removed(self):
-        return self._total_bytes_removed
+        return (self._total_bytes_added * BITS_IN_BYTE - self.remaining_bits) // BITS_IN_BYTE
+
+    @property
+    def refills(self):
+        return self._refills
 
 
 class SlidingWindow:
-    def __init__(self, size: int, fill: int = MIN_BYTE_VALUE, distance_from_end=False):
+    '''
+    Sliding window kept as the tail of one contiguous output buffer.
+    The window is always the last `size` bytes of the buffer, so references are slice copies of already decoded output.
+    Decoded bytes are written to `output_file` in blocks of at least `FLUSH_THRESHOLD` bytes.
+    Without an output file, decoded bytes are kept until they are collected with `take`.
+    '''
+    FLUSH_THRESHOLD = 1 << 20
+
+    def __init__(self, size: int, fill: int = MIN_BYTE_VALUE, distance_from_end=False, output_file: BinaryIO | None = None):
         assert MIN_BYTE_VALUE <= fill <= MAX_BYTE_VALUE, f'Initial character out of range [{MIN_BYTE_VALUE}, {MAX_BYTE_VALUE}]: {fill}'
+        self._size = size
+        # the initial fill is the window history before the first character, it is never written out
         self._buffer = bytearray([fill] * size)
-        self._first = 0
+        self._flushed = size
+        self._flush_at = size + self.FLUSH_THRESHOLD if output_file is not None else sys.maxsize
         self._distance_from_end = distance_from_end
-        self._inserted_count = 0
-    
+        self._output_file = output_file
+        self._total_bytes_flushed = 0
+
+    @classmethod
+    def from_contents(cls, contents: bytes, distance_from_end=False, output_file: BinaryIO | None = None, output_position: int = 0) -> 'SlidingWindow':
+        '''
+        Restores a window from a snapshot taken with `contents`.
+        :param contents: Window contents, oldest byte first.
+        :param output_position: Number of bytes decoded before the snapshot was taken.
+        '''
+        window = cls(len(contents), MIN_BYTE_VALUE, distance_from_end, output_file)
+        window._buffer[:] = contents
+        window._total_bytes_flushed = output_position
+        return window
+
+    def contents(self) -> bytes:
+        '''
+        :return: Snapshot of the window, oldest byte first.
+        '''
+        return bytes(self._buffer[-self._size:])
+
     def insert(self, character: int):
-        assert MIN_BYTE_VALUE <= character <= MAX_BYTE_VALUE, f'Inserted character out of range [{MIN_BYTE_VALUE}, {MAX_BYTE_VALUE}]: {character}'
-        self._buffer[self._first] = character
-        self._first += 1
-        if self._first >= len(self._buffer):
-            self._first = 0
-        if self._inserted_count < len(self._buffer):
-            self._inserted_count += 1
+        self._buffer.append(character)
+        if len(self._buffer) >= self._flush_at:
+            self.flush()
 
     def insert_multiple(self, characters: bytes):
-        for character in characters:
-            self.insert(character)
+        self._buffer += characters
+        if len(self._buffer) >= self._flush_at:
+            self.flush()
 
-    def at(self, position: int, length: int) -> bytearray:
-        assert 0 <= length <= len(self._buffer), f'Requested refererence length exceeds the size of dictionary ({len(self._buffer)}): {length}'
+    def _start(self, position: int) -> int:
         if self._distance_from_end:
-            position = self._first - 1 - position
-            while position < 0:
-                position += len(self._buffer)
-            while position >= len(self._buffer):
-                position -= len(self._buffer)
-            to_end = self._buffer[position:(position + length)]
-            remaining_length = length - len(to_end)
-            if remaining_length == 0:
-                return to_end
-            return to_end + self._buffer[:remaining_length]
+            position = self._size - 1 - position
+        return len(self._buffer) - self._size + position % self._size
+
+    def at(self, position: int, length: int) -> bytearray:
+        assert 0 <= length <= self._size, f'Requested refererence length exceeds the size of dictionary ({self._size}): {length}'
+        buffer = self._buffer
+        start = self._start(position)
+        end = start + length
+        if end <= len(buffer):
+            return buffer[start:end]
+        # references running past the newest byte continue from the oldest one
+        return buffer[start:] + buffer[(len(buffer) - self._size):(end - self._size)]
+
+    def copy(self, position: int, length: int):
+        '''
+        Appends `length` bytes referenced by `position` to the window, equivalent to `insert_multiple(at(position, length))`.
+        :param position: Reference distance.
+        :param length: Reference length.
+        '''
+        assert 0 <= length <= self._size, f'Requested refererence length exceeds the size of dictionary ({self._size}): {length}'
+        buffer = self._buffer
+        tail = len(buffer)
+        start = self._start(position)
+        end = start + length
+        if end <= tail:
+            buffer += buffer[start:end]
         else:
-            position += self._first
-            while position >= len(self._buffer):
-                position -= len(self._buffer)
-            to_end = self._buffer[position:(position + length)]
-            remaining_length = length - len(to_end)
-            if remaining_length == 0:
-                return to_end
-            return to_end + self._buffer[:remaining_length]
-
-
-STRING_ESCAPES_MAP = {
-    code: (f'\\x{code:02x}' if code <= 31 or code >= 127 else chr(code))
-    for code
-    in range(256)
-} | {
-    ord('\0'): '\\0',
-    ord('\n'): '\\n',
-    ord('\r'): '\\r',
-    ord('\t'): '\\t',
-    ord('\b'): '\\b',
-    ord('\f'): '\\f',
-    ord('\v'): '\\v',
-}
+            buffer += buffer[start:tail]
+            buffer += buffer[(tail - self._size):(end - self._size)]
+        if len(buffer) >= self._flush_at:
+            self.flush()
 
-def to_readable_string(data: bytes) -> str:
-    return ''.join(STRING_ESCAPES_MAP[byte] for byte in data)
+    def take(self) -> bytes:
+        '''
+        Collects all pending bytes and drops everything older than the window.
+        :return: Bytes decoded since the previous `take` or `flush`.
+        '''
+        buffer = self._buffer
+        with memoryview(buffer) as view:
+            pending = bytes(view[self._flushed:])
+        self._total_bytes_flushed += len(pending)
+        del buffer[:-self._size]
+        self._flushed = self._size
+        return pending
+
+    def flush(self):
+        '''
+        Writes all pending bytes to the output file and drops everything older than the window.
+        '''
+        if self._output_file is not None:
+            pending = self.take()
+            if pending:
+                self._output_file.write(pending)
+
+    @property
+    def output_position(self):
+        return self._total_bytes_flushed + len(self._buffer) - self._flushed
 
 
-def bits_from_byte(value: int, offset: int, length: int) -> int:
+def preset_window(config: LzssConfig) -> bytes | None:
     '''
-    Reads `length` bits from a single byte (`value`), skipping the first `offset` bits.
-    Read bits are converted to an unsigned integer.
-    :param value: Source byte.
-    :param offset: Offset in bits.
-    :param length: Length in bits.
-    :return: Unsigned integer in range [0; 2^`length`)
+    :return: Window contents preloaded from the preset dictionary of `config`, or None when the window starts filled with the first literal.
     '''
-    assert MIN_BYTE_VALUE <= value <= MAX_BYTE_VALUE, f'Byte value out of range [{MIN_BYTE_VALUE}, {MAX_BYTE_VALUE}]: {value}'
-    assert offset + length <= BITS_IN_BYTE, f'Requested bit count exceeds one byte ({BITS_IN_BYTE} bits): count {length}, bit offset {offset}'
-    offset_mask = MAX_BYTE_VALUE >> offset
-    shift = BITS_IN_BYTE - offset - length
-    return (value & offset_mask) >> shift
+    if not config.dictionary_id:
+        return None
+    # dictionary.py is only needed by streams using a preset dictionary
+    from dictionary import dictionary_window
+    return dictionary_window(config.dictionary_id, config.window_size)
+
 
-def bits_from_bytes(buffer: BitBuffer, length: int) -> int:
+def start_window(reader: BitReader, config: LzssConfig, output_file: BinaryIO | None) -> SlidingWindow:
     '''
-    Assembles an unsigned integer using `length` bits from a managed sequence of bytes (`buffer`), skipping offset if needed.
-    The integer is read in big endian order.
-    :param buffer: Source bytes (with offset).
-    :param length: Length in bits.
-    :return: Unsigned integer in range [0; 2^`length`)
+    Creates the window a stream starts with: preloaded from the preset dictionary, if any,
+    otherwise filled with the first character, which is read from `reader` and inserted.
     '''
-    buf = buffer.buffer
-    offset = buffer.offset
-    bytes_needed = ceil((offset + length) / BITS_IN_BYTE)
-    assert len(buf) >= bytes_needed, f'Requested bit count exceeds the length of buffer ({len(buf)} bytes {BITS_IN_BYTE} bits each): count {length}, bit offset {offset}'
-    buffer.add_offset(length)
+    preset = preset_window(config)
+    if preset is not None:
+        return SlidingWindow.from_contents(preset, config.distance_from_end, output_file)
+    flag = reader.read(config.flag_width)
+    assert (flag == 0) == config.flag_zero_means_literal, f'First code word not encoding a literal: expected {0 if config.flag_zero_means_literal else "non-zero value"}, got {flag}'
+    first_character = reader.read(BITS_IN_BYTE)
+    window = SlidingWindow(config.window_size, first_character, config.distance_from_end, output_file)
+    window.insert(first_character)
+    return window
 
-    pre_bits = min(BITS_IN_BYTE - offset, length)
-    value = bits_from_byte(buf[0], offset, pre_bits)
-    if pre_bits == length:
-        return value
 
-    buf = buf[1:]
-    full_bytes = floor((length - pre_bits) / BITS_IN_BYTE)
-    post_bits = length - pre_bits - full_bytes * BITS_IN_BYTE
-    for _ in range(full_bytes):
-        value <<= BITS_IN_BYTE
-        value += buf[0]
-        buf = buf[1:]
-    if post_bits == 0:
-        return value
+# only --debug output needs the escapes, so the table is built on first use
+_string_escapes_map: dict[int, str] = {}
+
+
+def string_escapes_map() -> dict[int, str]:
+    if not _string_escapes_map:
+        _string_escapes_map.update({
+            code: (f'\\x{code:02x}' if code <= 31 or code >= 127 else chr(code))
+            for code
+            in range(256)
+        } | {
+            ord('\0'): '\\0',
+            ord('\n'): '\\n',
+            ord('\r'): '\\r',
+            ord('\t'): '\\t',
+            ord('\b'): '\\b',
+            ord('\f'): '\\f',
+            ord('\v'): '\\v',
+        })
+    return _string_escapes_map
+
+
+def to_readable_string(data: bytes) -> str:
+    escapes = string_escapes_map()
+    return ''.join(escapes[byte] for byte in data)
 
-    value <<= post_bits
-    value += bits_from_byte(buf[0], 0, post_bits)
-    return value
 
 def print_debug(index: int, symbol: tuple[int] | tuple[int, int], config: LzssConfig, window: SlidingWindow | None):
     is_literal = len(symbol) == 1
@@ -195,76 +307,608 @@ def print_debug(index: int, symbol: tuple[int] | tuple[int, int], config: LzssCo
     print(file=sys.stderr)
 
 
-def decode(input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig, debug=False):
+def decode_debug(input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig):
+    '''
+    Instrumented variant of `decode`, describing every code word on stderr.
+    '''
     debug_index = 0
-    buffer = BitBuffer()
+    buffer = BitReader()
     is_literal = (lambda flag: flag == 0) if config.flag_zero_means_literal else (lambda flag: flag != 0)
-    if config.distance_width < 1:
-        config.distance_width = ceil(log2(config.window_size))
-    literal_code_word_width = config.flag_width + BITS_IN_BYTE
-    reference_code_word_width = config.flag_width + config.length_width + config.distance_width
-    min_code_word_width = min(literal_code_word_width, reference_code_word_width)
-    max_code_word_width = max(literal_code_word_width, reference_code_word_width)
-    if debug:
-        print(f'Code word width: [{min_code_word_width}, {max_code_word_width}]\n', file=sys.stderr)
+    min_code_word_width, max_code_word_width, literal_code_word_width, _ = code_word_widths(config)
+    print(f'Code word width: [{min_code_word_width}, {max_code_word_width}]\n', file=sys.stderr)
 
-    # read the first literal
-    buffer.add_bytes(input_file.read(ceil(literal_code_word_width / BITS_IN_BYTE)))
-    flag = bits_from_bytes(buffer, config.flag_width)
-    assert is_literal(flag), f'First code word not encoding a literal: expected {0 if config.flag_zero_means_literal else "non-zero value"}, got {flag}'
-    first_character = bits_from_bytes(buffer, BITS_IN_BYTE)
-    if debug:
+    preset = preset_window(config)
+    if preset is not None:
+        print(f'Window preloaded from dictionary {config.dictionary_id:08x}\n', file=sys.stderr)
+        window = SlidingWindow.from_contents(preset, config.distance_from_end, output_file)
+    else:
+        # read the first literal
+        buffer.add_bytes(input_file.read(ceil(literal_code_word_width / BITS_IN_BYTE)))
+        flag = buffer.read(config.flag_width)
+        assert is_literal(flag), f'First code word not encoding a literal: expected {0 if config.flag_zero_means_literal else "non-zero value"}, got {flag}'
+        first_character = buffer.read(BITS_IN_BYTE)
         print_debug(debug_index, (first_character, ), config, None)
         debug_index += 1
-    window = SlidingWindow(config.window_size, first_character, config.distance_from_end)
-    output_bytes_written = 0
-    output_bytes_written += output_file.write(bytes([first_character]))
+        window = SlidingWindow(config.window_size, first_character, config.distance_from_end, output_file)
+        window.insert(first_character)
 
     while True:
         if buffer.remaining_bits < max_code_word_width:
             read_bytes = input_file.read(BYTES_TO_READ_AT_ONCE)
             buffer.add_bytes(read_bytes)
-            if debug:
-                print(f'Read {len(read_bytes)} bytes, current total: {buffer.total_bytes_added}', file=sys.stderr)
-        if debug:
-            print(f'Bits remaining in buffer: {buffer.remaining_bits}', file=sys.stderr)
+            print(f'Read {len(read_bytes)} bytes, current total: {buffer.total_bytes_added}', file=sys.stderr)
+        print(f'Bits remaining in buffer: {buffer.remaining_bits}', file=sys.stderr)
         if buffer.remaining_bits < min_code_word_width:
-            if debug:
-                print(f'Exiting due to reaching EOF', file=sys.stderr)
+            print(f'Exiting due to reaching EOF', file=sys.stderr)
+            window.flush()
             return
-        flag = bits_from_bytes(buffer, config.flag_width)
-        if debug:
-            print(f'Read flag {flag}, bits remaining in buffer: {buffer.remaining_bits}', file=sys.stderr)
+        flag = buffer.read(config.flag_width)
+        print(f'Read flag {flag}, bits remaining in buffer: {buffer.remaining_bits}', file=sys.stderr)
         if is_literal(flag):
-            literal = bits_from_bytes(buffer, BITS_IN_BYTE)
-            if debug:
-                print(f'Read literal {to_readable_string(bytes([literal]))}, bits remaining in buffer: {buffer.remaining_bits}\n', file=sys.stderr)
-                print_debug(debug_index, (literal, ), config, window)
-                debug_index += 1
+            literal = buffer.read(BITS_IN_BYTE)
+            print(f'Read literal {to_readable_string(bytes([literal]))}, bits remaining in buffer: {buffer.remaining_bits}\n', file=sys.stderr)
+            print_debug(debug_index, (literal, ), config, window)
+            debug_index += 1
             window.insert(literal)
-            output_bytes_written += output_file.write(bytes([literal]))
         else:
-            distance = bits_from_bytes(buffer, config.distance_width)
-            if debug:
-                print(f'Read distance {distance}, bits remaining in buffer: {buffer.remaining_bits}', file=sys.stderr)
-            length = bits_from_bytes(buffer, config.length_width)
-            if debug:
-                print(f'Read length {length}, bits remaining in buffer: {buffer.remaining_bits}\n', file=sys.stderr)
+            distance = buffer.read(config.distance_width)
+            print(f'Read distance {distance}, bits remaining in buffer: {buffer.remaining_bits}', file=sys.stderr)
+            length = buffer.read(config.length_width)
+            print(f'Read length {length}, bits remaining in buffer: {buffer.remaining_bits}\n', file=sys.stderr)
             length += config.length_bias
-            if debug:
-                print_debug(debug_index, (distance, length), config, window)
-                debug_index += 1
-            referenced_characters = window.at(distance, length)
-            window.insert_multiple(referenced_characters)
-            output_bytes_written += output_file.write(referenced_characters)
-        if debug:
-            print(f'Input position: {buffer.total_bytes_removed}, output position: {output_bytes_written}', file=sys.stderr)
+            print_debug(debug_index, (distance, length), config, window)
+            debug_index += 1
+            window.copy(distance, length)
+        print(f'Input position: {buffer.total_bytes_removed}, output position: {window.output_position}', file=sys.stderr)
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='LZSS sliding window decoder')
-    parser.add_argument('input_file', type=argparse.FileType('rb'), nargs='?', help='Input file (to be decoded)')
-    parser.add_argument('output_file', type=argparse.FileType('wb'), nargs='?', help='Output file (target)')
+def decode_code_words(reader: BitReader, window: SlidingWindow, config: LzssConfig, count: int):
+    '''
+    Decodes `count` code words without checking for the end of the buffer.
+    The loop is specialized for the flag polarity and keeps the configuration in locals.
+    '''
+    read = reader.read
+    insert = window.insert
+    copy = window.copy
+    flag_width = config.flag_width
+    distance_width = config.distance_width
+    length_width = config.length_width
+    length_bias = config.length_bias
+    if config.flag_zero_means_literal:
+        for _ in range(count):
+            if read(flag_width):
+                distance = read(distance_width)
+                copy(distance, read(length_width) + length_bias)
+            else:
+                insert(read(BITS_IN_BYTE))
+    else:
+        for _ in range(count):
+            if read(flag_width):
+                insert(read(BITS_IN_BYTE))
+            else:
+                distance = read(distance_width)
+                copy(distance, read(length_width) + length_bias)
+
+
+def code_word_batches(reader: BitReader, refill: Callable[[], None], config: LzssConfig) -> Iterator[int]:
+    '''
+    Paces the decoding of a stream read in chunks: refills `reader` whenever the widest code word might not fit in it,
+    and stops at the end of the stream, when not even the shortest code word is left.
+    :param refill: Adds the next chunk of the stream to `reader`.
+    :return: Number of code words to decode next.
+    '''
+    min_code_word_width, max_code_word_width, _, _ = code_word_widths(config)
+    while True:
+        if reader.remaining_bits < max_code_word_width:
+            refill()
+        remaining_bits = reader.remaining_bits
+        if remaining_bits < min_code_word_width:
+            return
+        # no code word is longer than the widest one, so this many fit in the buffer
+        yield max(remaining_bits // max_code_word_width, 1)
+
+
+def kernel_supports(config: LzssConfig) -> bool:
+    '''
+    :return: True when the compiled kernel is available and can decode streams with `config`.
+    '''
+    code_word_widths(config)
+    return _kernel is not None and max(config.flag_width, config.distance_width, config.length_width) <= KERNEL_MAX_FIELD_WIDTH
+
+
+def decode_kernel(chunks: Iterable[bytes | memoryview], output_file: BinaryIO, config: LzssConfig, counts: 'np.ndarray | None' = None):
+    '''
+    Decodes a stream delivered in chunks with the compiled kernel, producing the same output and errors as `decode_python`.
+    The kernel keeps no state between calls: the window and the position of the next code word are passed back in.
+    :param counts: Int64 array the kernel adds the decoded code words to, see `kernel_counts`.
+    '''
+    code_word_widths(config)
+    parameters = (
+        config.window_size, config.length_width, config.length_bias, config.distance_width, config.flag_width,
+        config.flag_zero_means_literal, config.distance_from_end)
+    pending = b''
+    bit_offset = 0
+    window = preset_window(config)
+    chunks = iter(chunks)
+    at_end = False
+    while not at_end:
+        chunk = next(chunks, None)
+        at_end = chunk is None
+        if not at_end:
+            pending = pending[(bit_offset // BITS_IN_BYTE):] + chunk
+            bit_offset %= BITS_IN_BYTE
+        # the kernel stops after KERNEL_OUTPUT_LIMIT bytes, so memory use stays bounded for highly compressed input
+        while True:
+            decoded, bit_offset, window = _kernel.replay(pending, bit_offset, window, *parameters, at_end, KERNEL_OUTPUT_LIMIT, counts)
+            if decoded:
+                output_file.write(decoded)
+            if len(decoded) < KERNEL_OUTPUT_LIMIT:
+                break
+
+
+def decode(input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig, debug=False, stats=False) -> 'DecodeStats | None':
+    '''
+    Decodes with the compiled kernel when it is available, otherwise with `decode_python`.
+    :param debug: Describe every code word on stderr, see `decode_debug`.
+    :param stats: Collect metrics of the decoder used, see `decode_kernel_with_stats` and `decode_with_stats`.
+    :return: Decoding statistics when `stats` is set.
+    '''
+    if debug:
+        return decode_debug(input_file, output_file, config)
+    if stats:
+        if kernel_supports(config):
+            return decode_kernel_with_stats(input_file, output_file, config)
+        return decode_with_stats(input_file, output_file, config)
+    if kernel_supports(config):
+        return decode_kernel(iter(lambda: input_file.read(BYTES_TO_PARSE_AT_ONCE), b''), output_file, config)
+    return decode_python(input_file, output_file, config)
+
+
+def decode_python(input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig):
+    '''
+    Pure Python decoder, used when the compiled kernel is not available.
+    '''
+    reader = BitReader()
+    reader.add_bytes(input_file.read(BYTES_TO_PARSE_AT_ONCE))
+    window = start_window(reader, config, output_file)
+    for count in code_word_batches(reader, lambda: reader.add_bytes(input_file.read(BYTES_TO_PARSE_AT_ONCE)), config):
+        decode_code_words(reader, window, config, count)
+    window.flush()
+
+
+def decode_buffer(data: bytes | memoryview, output_file: BinaryIO, config: LzssConfig):
+    '''
+    Decodes a stream held entirely in memory, e.g. a memory-mapped file, reading it in place.
+    '''
+    if kernel_supports(config):
+        with memoryview(data) as view:
+            # chunks are copied, so no view of `data` outlives this call (a memory map cannot be closed while one exists)
+            return decode_kernel((bytes(view[i:(i + BYTES_TO_PARSE_AT_ONCE)]) for i in range(0, len(view), BYTES_TO_PARSE_AT_ONCE)), output_file, config)
+    reader = BitReader(data)
+    window = start_window(reader, config, output_file)
+    # the whole stream is in the reader already, there is nothing to refill it with
+    for count in code_word_batches(reader, lambda: None, config):
+        decode_code_words(reader, window, config, count)
+    window.flush()
+
+
+def gather_bits(bits: 'np.ndarray', positions: 'np.ndarray', length: int) -> 'np.ndarray':
+    '''
+    Assembles unsigned integers using `length` bits read from every position in `positions`.
+    The integers are read in big endian order.
+    :param bits: Source bits, one per element.
+    :param positions: Bit offsets of the first bit of every integer.
+    :param length: Length in bits.
+    :return: Array of unsigned integers in range [0; 2^`length`)
+    '''
+    import numpy as np
+    values = np.zeros(len(positions), dtype=np.int64)
+    for bit in range(length):
+        values <<= 1
+        values |= bits[positions + bit]
+    return values
+
+
+def parse_tokens(bits: 'np.ndarray', start: int, config: LzssConfig) -> 'tuple[np.ndarray, np.ndarray, np.ndarray, int]':
+    '''
+    Splits unpacked bits into code words, starting at bit `start` and stopping at the first incomplete code word.
+    Only the walk from one code word to the next is sequential, all fields are extracted in bulk.
+    :param bits: Source bits, one per element (as returned by `np.unpackbits`).
+    :param start: Offset of the first code word in bits.
+    :param config: Decoder configuration.
+    :return: Tuple of token kinds (true for literals), literals or distances, lengths (zero for literals)
+        and the offset of the first unparsed bit.
+    '''
+    import numpy as np
+    min_code_word_width, max_code_word_width, literal_code_word_width, reference_code_word_width = code_word_widths(config)
+    total_bits = len(bits)
+    if total_bits - start < min_code_word_width:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(0, dtype=bool), empty, empty, start
+
+    # pad, so that fields of the wider code word kind can be gathered at every position
+    bits = np.concatenate((bits, np.zeros(max_code_word_width, dtype=bits.dtype)))
+    flag_positions = np.arange(total_bits - min_code_word_width + 1)
+    flags = gather_bits(bits, flag_positions, config.flag_width)
+    literal_flags = (flags == 0) if config.flag_zero_means_literal else (flags != 0)
+    widths = np.where(literal_flags, literal_code_word_width, reference_code_word_width).tolist()
+
+    starts = []
+    position = start
+    last_position = len(widths) - 1
+    while position <= last_position:
+        next_position = position + widths[position]
+        if next_position > total_bits:
+            break
+        starts.append(position)
+        position = next_position
+
+    starts = np.array(starts, dtype=np.int64)
+    kinds = literal_flags[starts]
+    field_positions = starts + config.flag_width
+    literals = gather_bits(bits, field_positions, BITS_IN_BYTE)
+    distances = gather_bits(bits, field_positions, config.distance_width)
+    lengths = gather_bits(bits, field_positions + config.distance_width, config.length_width) + config.length_bias
+    values = np.where(kinds, literals, distances)
+    lengths = np.where(kinds, 0, lengths)
+    return kinds, values, lengths, position
+
+
+def replay_tokens(kinds: 'np.ndarray', values: 'np.ndarray', lengths: 'np.ndarray', window: SlidingWindow):
+    '''
+    Replays parsed tokens through the sliding window.
+    '''
+    insert = window.insert
+    copy = window.copy
+    for is_literal, value, length in zip(kinds.tolist(), values.tolist(), lengths.tolist()):
+        if is_literal:
+            insert(value)
+        else:
+            copy(value, length)
+
+
+def decode_bulk(input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig):
+    '''
+    Decodes the same stream as `decode`, but parses whole input chunks into token arrays before replaying them.
+    '''
+    import numpy as np
+    min_code_word_width, _, _, _ = code_word_widths(config)
+
+    pending = b''
+    offset = 0
+    preset = preset_window(config)
+    window = SlidingWindow.from_contents(preset, config.distance_from_end, output_file) if preset is not None else None
+    while True:
+        read_bytes = input_file.read(BYTES_TO_PARSE_AT_ONCE)
+        pending += read_bytes
+        bits = np.unpackbits(np.frombuffer(pending, dtype=np.uint8))
+        kinds, values, lengths, end = parse_tokens(bits, offset, config)
+        if window is None and len(kinds) > 0:
+            assert kinds[0], f'First code word not encoding a literal: expected {0 if config.flag_zero_means_literal else "non-zero value"}'
+            first_character = int(values[0])
+            window = SlidingWindow(config.window_size, first_character, config.distance_from_end, output_file)
+            window.insert(first_character)
+            kinds, values, lengths = kinds[1:], values[1:], lengths[1:]
+        if window is not None:
+            replay_tokens(kinds, values, lengths, window)
+        pending = pending[(end // BITS_IN_BYTE):]
+        offset = end % BITS_IN_BYTE
+        if not read_bytes:
+            remaining_bits = len(pending) * BITS_IN_BYTE - offset
+            assert window is not None and remaining_bits < min_code_word_width, f'Requested bit count exceeds the length of buffer ({remaining_bits} bits)'
+            window.flush()
+            return
+
+
+@dataclass
+class DecodeStats:
+    decoder: str = 'python'  # 'python' or 'kernel', the decoder the metrics were collected from
+    literals: int = 0
+    references: int = 0
+    input_bytes: int = 0
+    output_bytes: int = 0
+    input_reads: int = 0
+    refills: int = 0  # bit reader accumulator refills, Python decoder only
+    length_histogram: list[int] = field(default_factory=list)  # index is the reference length (in bytes)
+    distance_histogram: list[int] = field(default_factory=list)  # index is the bit length of the reference distance
+    read_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    copy_seconds: float = 0.0
+    replay_seconds: float = 0.0  # the compiled kernel parses and copies in one pass
+    write_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    def add_tokens(self, kinds: 'np.ndarray', values: 'np.ndarray', lengths: 'np.ndarray'):
+        import numpy as np
+        references = ~kinds
+        self.literals += int(np.count_nonzero(kinds))
+        self.references += int(np.count_nonzero(references))
+        self.length_histogram = _add_histograms(self.length_histogram, np.bincount(lengths[references]))
+        # distances are bucketed by bit length, so the histogram stays small for any window size
+        distance_bit_lengths = np.frexp(values[references].astype(np.float64))[1]
+        self.distance_histogram = _add_histograms(self.distance_histogram, np.bincount(distance_bit_lengths))
+
+    def save(self, output_file: TextIO):
+        import json
+        json.dump(asdict(self), output_file, indent=2)
+
+    def summary(self) -> str:
+        tokens = self.literals + self.references
+        if self.decoder == 'kernel':
+            inputs = f'{self.input_reads} reads'
+            stages = f'replay {self.replay_seconds:.3f} s'
+        else:
+            inputs = f'{self.input_reads} reads, {self.refills} refills'
+            stages = f'parse {self.parse_seconds:.3f} s, copy {self.copy_seconds:.3f} s'
+        return '\n'.join([
+            f'{tokens} code words ({self.decoder} decoder): {self.literals} literals, {self.references} references',
+            f'{self.input_bytes} bytes in ({inputs}), {self.output_bytes} bytes out',
+            f'{self.total_seconds:.3f} s: read {self.read_seconds:.3f} s, {stages}, write {self.write_seconds:.3f} s',
+            f'{self.output_bytes / max(self.total_seconds, 1e-9) / 1e6:.2f} MB/s, {self.total_seconds / max(tokens, 1) * 1e9:.0f} ns per code word',
+        ])
+
+
+def _add_histograms(a: list[int], b: 'np.ndarray') -> list[int]:
+    import numpy as np
+    total = np.zeros(max(len(a), len(b)), dtype=np.int64)
+    total[:len(a)] += np.asarray(a, dtype=np.int64)
+    total[:len(b)] += b
+    return total.tolist()
+
+
+class _TimedWriter:
+    '''
+    Output file wrapper adding the time spent in `write` to `stats.write_seconds` and counting the bytes written.
+    '''
+    def __init__(self, output_file: BinaryIO, stats: DecodeStats):
+        self._output_file = output_file
+        self._stats = stats
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        start = time.perf_counter()
+        written = self._output_file.write(data)
+        self._stats.write_seconds += time.perf_counter() - start
+        self.written += len(data)
+        return written
+
+
+def parse_code_words(reader: BitReader, config: LzssConfig, count: int) -> 'tuple[np.ndarray, np.ndarray, np.ndarray]':
+    '''
+    Reads `count` code words with the same bit reader as `decode_code_words`, without replaying them.
+    :return: Token arrays as returned by `parse_tokens`.
+    '''
+    import numpy as np
+    read = reader.read
+    flag_width = config.flag_width
+    distance_width = config.distance_width
+    length_width = config.length_width
+    zero_means_literal = config.flag_zero_means_literal
+    kinds = []
+    values = []
+    lengths = []
+    for _ in range(count):
+        if (read(flag_width) == 0) == zero_means_literal:
+            kinds.append(True)
+            values.append(read(BITS_IN_BYTE))
+            lengths.append(0)
+        else:
+            kinds.append(False)
+            values.append(read(distance_width))
+            lengths.append(read(length_width))
+    kinds = np.array(kinds, dtype=bool)
+    lengths = np.where(kinds, 0, np.array(lengths, dtype=np.int64) + config.length_bias)
+    return kinds, np.array(values, dtype=np.int64), lengths
+
+
+def kernel_counts(config: LzssConfig) -> 'np.ndarray':
+    '''
+    :return: Zeroed counts for `_kernel.replay`: literals, references, references by the bit length of their distance,
+        then references by their length (up to the longest one `config` allows).
+    '''
+    import numpy as np
+    code_word_widths(config)
+    max_length = min(config.window_size, (1 << config.length_width) - 1 + config.length_bias)
+    return np.zeros(2 + KERNEL_MAX_FIELD_WIDTH + 1 + max(max_length, 0) + 1, dtype=np.int64)
+
+
+def decode_kernel_with_stats(input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig) -> DecodeStats:
+    '''
+    Decodes with the compiled kernel like `decode`, collecting the metrics of `decode_with_stats` on the way.
+    The kernel parses and copies in one pass, timed as `replay_seconds`; code words are counted by the kernel itself.
+    :return: Decoding statistics.
+    '''
+    import numpy as np
+    stats = DecodeStats(decoder='kernel')
+    start = time.perf_counter()
+
+    def read_chunks() -> Iterator[bytes]:
+        while True:
+            read_start = time.perf_counter()
+            chunk = input_file.read(BYTES_TO_PARSE_AT_ONCE)
+            stats.read_seconds += time.perf_counter() - read_start
+            stats.input_reads += 1
+            if not chunk:
+                return
+            stats.input_bytes += len(chunk)
+            yield chunk
+
+    counts = kernel_counts(config)
+    timed_output = _TimedWriter(output_file, stats)
+    decode_kernel(read_chunks(), timed_output, config, counts)
+
+    references_end = 2
+    lengths_start = references_end + KERNEL_MAX_FIELD_WIDTH + 1
+    stats.literals, stats.references = (int(count) for count in counts[:references_end])
+    # trailing zeros dropped, as in the histograms counted by `decode_with_stats`
+    stats.distance_histogram = np.trim_zeros(counts[references_end:lengths_start], 'b').tolist()
+    stats.length_histogram = np.trim_zeros(counts[lengths_start:], 'b').tolist()
+    stats.output_bytes = timed_output.written
+    stats.total_seconds = time.perf_counter() - start
+    stats.replay_seconds = stats.total_seconds - stats.read_seconds - stats.write_seconds
+    return stats
+
+
+def decode_with_stats(input_file: BinaryIO, output_file: BinaryIO, config: LzssConfig) -> DecodeStats:
+    '''
+    Decodes the same stream as `decode` with the pure Python decoder, collecting metrics on the way.
+    Code words are read in batches and replayed afterwards, so the time spent reading bits, copying within
+    the window and writing output is measured once per batch rather than once per code word.
+    :return: Decoding statistics.
+    '''
+    stats = DecodeStats()
+    start = time.perf_counter()
+    reader = BitReader()
+
+    def read_input():
+        read_start = time.perf_counter()
+        reader.add_bytes(input_file.read(BYTES_TO_PARSE_AT_ONCE))
+        stats.read_seconds += time.perf_counter() - read_start
+        stats.input_reads += 1
+
+    read_input()
+    window = start_window(reader, config, _TimedWriter(output_file, stats))
+    if not config.dictionary_id:
+        # the first literal
+        stats.literals += 1
+
+    for count in code_word_batches(reader, read_input, config):
+        parse_start = time.perf_counter()
+        kinds, values, lengths = parse_code_words(reader, config, count)
+        stats.parse_seconds += time.perf_counter() - parse_start
+        copy_start = time.perf_counter()
+        write_seconds = stats.write_seconds
+        replay_tokens(kinds, values, lengths, window)
+        # flushes triggered while replaying are output I/O, not window copies
+        stats.copy_seconds += time.perf_counter() - copy_start - (stats.write_seconds - write_seconds)
+        stats.add_tokens(kinds, values, lengths)
+    window.flush()
+
+    stats.input_bytes = reader.total_bytes_added
+    stats.output_bytes = window.output_position
+    stats.refills = reader.refills
+    stats.total_seconds = time.perf_counter() - start
+    return stats
+
+
+class LzssDecoder:
+    '''
+    Incremental decoder keeping the bit reader and the sliding window between calls.
+    Memory use is bounded by the window size and the size of a single chunk, not by the length of the stream.
+    '''
+    def __init__(self, config: LzssConfig):
+        self._min_code_word_width, self._max_code_word_width, self._literal_code_word_width, _ = code_word_widths(config)
+        self._config = config
+        self._reader = BitReader()
+        self._window: SlidingWindow | None = None
+        self._skip_bits = 0
+        if config.dictionary_id:
+            self._window = start_window(self._reader, config, None)
+
+    @classmethod
+    def resume(cls, config: LzssConfig, window_contents: bytes, bit_offset: int, output_position: int) -> 'LzssDecoder':
+        '''
+        Creates a decoder continuing a stream from the middle.
+        The caller feeds the stream starting at byte `bit_offset // 8`, the remaining bits of that byte are skipped.
+        :param window_contents: Window snapshot at the resume point, oldest byte first.
+        :param bit_offset: Position of the next code word in the stream (in bits).
+        :param output_position: Number of bytes decoded before the resume point.
+        '''
+        decoder = cls(config)
+        decoder._window = SlidingWindow.from_contents(window_contents, config.distance_from_end, output_position=output_position)
+        decoder._skip_bits = bit_offset % BITS_IN_BYTE
+        return decoder
+
+    def feed(self, chunk: bytes) -> bytes:
+        '''
+        Decodes all code words completed by `chunk`.
+        :param chunk: Next part of the encoded stream.
+        :return: Bytes decoded from this chunk.
+        '''
+        self._reader.add_bytes(chunk)
+        self._decode(at_end=False)
+        return self._window.take() if self._window is not None else b''
+
+    def flush(self) -> bytes:
+        '''
+        Decodes the code words left at the end of the stream.
+        :return: Remaining decoded bytes.
+        '''
+        self._decode(at_end=True)
+        assert self._window is not None, f'Stream ended before the first code word ({self._reader.remaining_bits} bits)'
+        return self._window.take()
+
+    def _decode(self, at_end: bool):
+        config = self._config
+        reader = self._reader
+        read = reader.read
+        # until the end of the stream only complete code words of either kind are decoded
+        required_bits = self._min_code_word_width if at_end else self._max_code_word_width
+        if self._skip_bits:
+            if reader.remaining_bits < self._skip_bits:
+                return
+            read(self._skip_bits)
+            self._skip_bits = 0
+        if self._window is None:
+            if not at_end and reader.remaining_bits < self._literal_code_word_width:
+                return
+            self._window = start_window(reader, config, None)
+
+        while reader.remaining_bits >= required_bits:
+            # as many code words as surely fit, single code words only for the last few bits
+            decode_code_words(reader, self._window, config, max(reader.remaining_bits // self._max_code_word_width, 1))
+
+
+def iter_decode(input_file: BinaryIO, config: LzssConfig, chunk_size: int = BYTES_TO_PARSE_AT_ONCE) -> Iterator[bytes]:
+    '''
+    Decodes `input_file` chunk by chunk, yielding decoded blocks as soon as they are available.
+    '''
+    decoder = LzssDecoder(config)
+    while read_bytes := input_file.read(chunk_size):
+        if block := decoder.feed(read_bytes):
+            yield block
+    if block := decoder.flush():
+        yield block
+
+
+def iter_decode_chunks(chunks: Iterable[bytes], config: LzssConfig) -> Iterator[bytes]:
+    '''
+    Decodes a stream delivered as an iterable of chunks (e.g. from a queue), yielding decoded blocks.
+    '''
+    decoder = LzssDecoder(config)
+    for chunk in chunks:
+        if block := decoder.feed(chunk):
+            yield block
+    if block := decoder.flush():
+        yield block
+
+
+async def iter_decode_async(reader: 'asyncio.StreamReader', config: LzssConfig, chunk_size: int = BYTES_TO_PARSE_AT_ONCE) -> AsyncIterator[bytes]:
+    '''
+    Decodes a stream read from an asyncio `reader`, yielding decoded blocks as soon as they are available.
+    '''
+    decoder = LzssDecoder(config)
+    while read_bytes := await reader.read(chunk_size):
+        if block := decoder.feed(read_bytes):
+            yield block
+    if block := decoder.flush():
+        yield block
+
+
+def peek(input_file: BinaryIO, size: int) -> bytes:
+    '''
+    :param input_file: Buffered or seekable source.
+    :return: Up to `size` first bytes of `input_file`, without consuming them.
+    '''
+    if hasattr(input_file, 'peek'):
+        return input_file.peek(size)[:size]
+    position = input_file.tell()
+    data = input_file.read(size)
+    input_file.seek(position)
+    return data
+
+
+def add_config_arguments(parser: 'argparse.ArgumentParser'):
     parser.add_argument('--window-size', '-w', type=int, default=256, help='Sliding window size (in bytes)')
     parser.add_argument('--length-width', '-l', type=int, default=8, help='Reference length width (in bits)')
     parser.add_argument('--length-bias', '-b', type=int, default=0, help='Reference length bias')
@@ -272,13 +916,135 @@ if __name__ == '__main__':
     parser.add_argument('--flag-width', type=int, default=1, help='Flag width (in bits)')
     parser.add_argument('--invert-flag', action='store_true', help='Treat zero as literal flag and others as reference flag')
     parser.add_argument('--back-distance', action='store_true', help='Count distance from the end of the window')
+    parser.add_argument('--dictionary', default=None, help='Preset dictionary file (see dictionary.py) preloading the window')
+
+
+def config_from_args(args: 'argparse.Namespace') -> LzssConfig:
+    dictionary_id = 0
+    if args.dictionary is not None:
+        from dictionary import SEARCH_PATH_VARIABLE, load_dictionary
+        dictionary_id = load_dictionary(args.dictionary)
+        # worker processes look dictionaries up by ID, possibly in a fresh interpreter
+        os.environ[SEARCH_PATH_VARIABLE] = os.pathsep.join(filter(None, [args.dictionary, os.environ.get(SEARCH_PATH_VARIABLE)]))
+    return LzssConfig(args.window_size, args.length_width, args.length_bias, args.distance_width, args.flag_width, not args.invert_flag, args.back_distance, dictionary_id)
+
+
+def main():
+    '''
+    Command line interface, run by `python decoder` (see __main__.py) or `python decoder.py`.
+    '''
+    global _kernel
+    import argparse
+    parser = argparse.ArgumentParser(description='LZSS sliding window decoder')
+    parser.add_argument('input_file', type=argparse.FileType('rb'), nargs='?', help='Input file (to be decoded)')
+    parser.add_argument('output_file', type=argparse.FileType('wb'), nargs='?', help='Output file (target)')
+    add_config_arguments(parser)
     parser.add_argument('--debug', action='store_true', help='Run in debug mode')
+    parser.add_argument('--bulk', action='store_true', help='Parse whole input chunks with NumPy before replaying them')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for decoding framed containers')
+    parser.add_argument('--mmap', action='store_true', help='Memory-map the input (and the output, when its size is known); requires file arguments')
+    parser.add_argument('--output-size', type=int, default=0, help='Expected decoded size (in bytes), lets --mmap preallocate the output')
+    parser.add_argument('--no-kernel', action='store_true', help='Use the pure Python decoder even when the compiled kernel is available')
+    input_format = parser.add_mutually_exclusive_group()
+    input_format.add_argument('--raw', action='store_true', help='Decode inputs as raw streams, even when they start like a framed container')
+    input_format.add_argument('--container', action='store_true', help='Decode inputs as framed containers, without checking their header first')
+    parser.add_argument('--verify', action='store_true', help='Decode without writing output, checking container block checksums; no output file is taken')
+    parser.add_argument('--stats', action='store_true', help='Print decoding metrics to stderr (raw streams only)')
+    parser.add_argument('--stats-json', type=argparse.FileType('w'), default=None, help='Write decoding metrics as JSON (raw streams only)')
+    parser.add_argument('--profile', default=None, help='Run under cProfile and write the profile to this file (readable with pstats)')
+    parser.add_argument('--batch', nargs='+', default=None, metavar='PATH', help='Decode many files: directories (files ending with --suffix) or glob patterns; replaces the positional arguments')
+    parser.add_argument('--manifest', type=argparse.FileType('r'), default=None, help='Decode many files listed as JSON lines of {"input", "output", optional config fields}')
+    parser.add_argument('--output-dir', default=None, help='Output directory for --batch; outputs are written next to the inputs by default')
+    parser.add_argument('--suffix', default='.lzss', help='Suffix of encoded files, removed from output names in --batch mode')
+    parser.add_argument('--jobs', type=int, default=1, help='Files decoded at once in --batch and --manifest modes')
+    parser.add_argument('--threads', action='store_true', help='Use a thread pool instead of a process pool for --jobs')
     args = parser.parse_args()
+    if args.no_kernel:
+        # also seen by worker processes, which import this module again
+        os.environ['LZSS_NO_KERNEL'] = '1'
+        _kernel = None
+
+    # None detects the format of every input from its header
+    container = True if args.container else False if args.raw else None
+
+    if args.batch is not None or args.manifest is not None:
+        if args.input_file is not None or args.output_file is not None:
+            parser.error('--batch and --manifest replace the input and output file arguments')
+        from batch import collect_tasks, decode_batch, read_manifest, summary
+        tasks = collect_tasks(args.batch, config_from_args(args), args.output_dir, args.suffix, container) if args.batch is not None else []
+        if args.manifest is not None:
+            tasks += read_manifest(args.manifest, config_from_args(args), container)
+        start = time.perf_counter()
+        results = decode_batch(tasks, args.jobs, args.threads)
+        for result in results:
+            if result.error is not None:
+                print(f'{result.input_path}: {result.error}', file=sys.stderr)
+        print(summary(results, time.perf_counter() - start), file=sys.stderr)
+        sys.exit(1 if any(result.error is not None for result in results) else 0)
 
     input_file = args.input_file if args.input_file is not None else sys.stdin.buffer
     output_file = args.output_file if args.output_file is not None else sys.stdout.buffer
     # input_file = open(r'D:\Programowanie\studia\KODA\koda-lzss\py\examples\aaaaaaaaaaaaaaa.lzss', 'rb')
     # output_file = sys.stdout.buffer
-    config = LzssConfig(args.window_size, args.length_width, args.length_bias, args.distance_width, args.flag_width, not args.invert_flag, args.back_distance)
-    decode(input_file, output_file, config, args.debug)
- 
\ No newline at end of file
+    config = config_from_args(args)
+    if container is None:
+        # only inputs starting with the magic need the header checks of container.py
+        if peek(input_file, len(CONTAINER_MAGIC)) == CONTAINER_MAGIC:
+            from container import is_container
+            container = is_container(input_file)
+        else:
+            container = False
+    if args.verify:
+        if args.output_file is not None:
+            parser.error('--verify does not write output')
+        from container import ChecksumWriter, CorruptBlockError, verify_container
+        try:
+            if container:
+                print(f'OK: {verify_container(input_file, args.workers)} bytes decoded', file=sys.stderr)
+            else:
+                # raw streams carry no checksums, the CRC32 of the output can be compared with that of the original
+                with open(os.devnull, 'wb') as null_file:
+                    checksum_writer = ChecksumWriter(null_file)
+                    decode(input_file, checksum_writer, config)
+                print(f'OK: {checksum_writer.size} bytes decoded, CRC32 {checksum_writer.checksum:08x}', file=sys.stderr)
+        except (CorruptBlockError, AssertionError) as error:
+            sys.exit(f'FAILED: {error}')
+        sys.exit(0)
+    collect_stats = args.stats or args.stats_json is not None
+    if collect_stats and (args.mmap or args.debug or container):
+        parser.error('--stats and --stats-json are only available for raw streams decoded without --mmap or --debug')
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if args.mmap:
+        if args.input_file is None or args.output_file is None:
+            parser.error('--mmap requires input and output file arguments')
+        from mapped import decode_mapped
+        args.output_file.close()
+        decode_mapped(args.input_file.name, args.output_file.name, config, args.output_size, container)
+    elif container:
+        # framed containers carry their own configuration
+        from container import decode_container
+        decode_container(input_file, output_file, args.workers)
+    elif collect_stats:
+        stats = decode(input_file, output_file, config, stats=True)
+        if args.stats:
+            print(stats.summary(), file=sys.stderr)
+        if args.stats_json is not None:
+            stats.save(args.stats_json)
+    elif args.bulk and not args.debug:
+        decode_bulk(input_file, output_file, config)
+    else:
+        decode(input_file, output_file, config, args.debug)
+
+    if args.profile is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+
+if __name__ == '__main__':
+    # the modules imported by `main` import this one by name, they share this copy instead of running it again
+    sys.modules.setdefault('decoder', sys.modules[__name__])
+    main()
@@ -0,0 +1,237 @@
+import glob
+from math import ceil
+import os
+import struct
+import sys
+from typing import TYPE_CHECKING, BinaryIO
+import zlib
+
+# decoders look dictionaries up through this module, only training needs NumPy
+if TYPE_CHECKING:
+    import numpy as np
+
+from decoder import BITS_IN_BYTE, MIN_BYTE_VALUE, LzssConfig, add_config_arguments, config_from_args
+
+DICTIONARY_MAGIC = b'LZSD'
+DICTIONARY_VERSION = 1
+DICTIONARY_HEADER_FORMAT = '>4sBI'
+DICTIONARY_HEADER_SIZE = struct.calcsize(DICTIONARY_HEADER_FORMAT)
+DICTIONARY_SUFFIX = '.lzsd'
+SEARCH_PATH_VARIABLE = 'LZSS_DICTIONARY_PATH'
+
+DEFAULT_SEGMENT_SIZE = 64
+DEFAULT_KMER_SIZE = 6
+MAX_KMER_SIZE = 8
+
+# dictionaries used in this process, by ID, and the windows built from them, by ID and window size
+_contents: dict[int, bytes] = {}
+_windows: dict[tuple[int, int], bytes] = {}
+
+
+def make_id(content: bytes) -> int:
+    '''
+    :return: ID of a dictionary: the CRC32 of its contents, never zero (which means no dictionary).
+    '''
+    return zlib.crc32(content) or 1
+
+
+def save_dictionary(output_file: BinaryIO, content: bytes) -> int:
+    '''
+    Writes a dictionary file: a header recording the ID, followed by the contents.
+    :return: Number of bytes written.
+    '''
+    return output_file.write(struct.pack(DICTIONARY_HEADER_FORMAT, DICTIONARY_MAGIC, DICTIONARY_VERSION, make_id(content))) \
+        + output_file.write(content)
+
+
+def read_dictionary(input_file: BinaryIO) -> tuple[int, bytes]:
+    '''
+    Reads a dictionary file, checking its contents against the recorded ID.
+    :return: Dictionary ID and contents.
+    '''
+    header = input_file.read(DICTIONARY_HEADER_SIZE)
+    assert len(header) == DICTIONARY_HEADER_SIZE, f'Dictionary header truncated: expected {DICTIONARY_HEADER_SIZE} bytes, got {len(header)}'
+    magic, version, dictionary_id = struct.unpack(DICTIONARY_HEADER_FORMAT, header)
+    assert magic == DICTIONARY_MAGIC, f'Not a preset dictionary: expected magic {DICTIONARY_MAGIC}, got {magic}'
+    assert version == DICTIONARY_VERSION, f'Unsupported dictionary version: expected {DICTIONARY_VERSION}, got {version}'
+    content = input_file.read()
+    assert make_id(content) == dictionary_id, f'Dictionary {dictionary_id:08x} corrupted: contents have ID {make_id(content):08x}'
+    return dictionary_id, content
+
+
+def register_dictionary(content: bytes) -> int:
+    '''
+    Makes `content` available to every decoder and encoder in this process.
+    :return: Dictionary ID, to be set as `LzssConfig.dictionary_id`.
+    '''
+    dictionary_id = make_id(content)
+    _contents.setdefault(dictionary_id, content)
+    return dictionary_id
+
+
+def load_dictionary(path: str) -> int:
+    '''
+    Reads a dictionary file and registers its contents, see `register_dictionary`.
+    :return: Dictionary ID.
+    '''
+    with open(path, 'rb') as input_file:
+        _, content = read_dictionary(input_file)
+    return register_dictionary(content)
+
+
+def search_path() -> list[str]:
+    '''
+    :return: Dictionary files and directories searched for dictionaries by ID:
+        the entries of the `LZSS_DICTIONARY_PATH` environment variable, then the current directory.
+    '''
+    return [entry for entry in os.environ.get(SEARCH_PATH_VARIABLE, '').split(os.pathsep) if entry] + [os.curdir]
+
+
+def _peek_id(path: str) -> int | None:
+    with open(path, 'rb') as input_file:
+        header = input_file.read(DICTIONARY_HEADER_SIZE)
+    if len(header) < DICTIONARY_HEADER_SIZE or not header.startswith(DICTIONARY_MAGIC):
+        return None
+    return struct.unpack(DICTIONARY_HEADER_FORMAT, header)[2]
+
+
+def find_dictionary(dictionary_id: int) -> bytes:
+    '''
+    Looks a dictionary up by ID, reading it from the search path (directories are searched for files ending with `DICTIONARY_SUFFIX`) on first use.
+    Dictionaries stay loaded for the lifetime of the process, so decoding many streams reads every dictionary once.
+    :return: Dictionary contents.
+    '''
+    if dictionary_id in _contents:
+        return _contents[dictionary_id]
+    for entry in search_path():
+        paths = sorted(glob.glob(os.path.join(glob.escape(entry), '*' + DICTIONARY_SUFFIX))) if os.path.isdir(entry) else [entry]
+        for path in paths:
+            if os.path.isfile(path) and _peek_id(path) == dictionary_id:
+                load_dictionary(path)
+                return _contents[dictionary_id]
+    raise AssertionError(f'Preset dictionary {dictionary_id:08x} not found in {search_path()}')
+
+
+def dictionary_window(dictionary_id: int, window_size: int) -> bytes:
+    '''
+    :return: Initial window contents for a dictionary: its last `window_size` bytes,
+        preceded by `MIN_BYTE_VALUE` bytes when the dictionary is smaller than the window.
+    '''
+    key = (dictionary_id, window_size)
+    if key not in _windows:
+        tail = find_dictionary(dictionary_id)[-window_size:]
+        _windows[key] = bytes([MIN_BYTE_VALUE]) * (window_size - len(tail)) + tail
+    return _windows[key]
+
+
+def kmer_keys(data: 'np.ndarray', kmer_size: int) -> 'np.ndarray':
+    '''
+    :return: The `kmer_size` bytes starting at every position of `data`, packed into one integer per position.
+    '''
+    import numpy as np
+    count = max(len(data) - kmer_size + 1, 0)
+    keys = np.zeros(count, dtype=np.uint64)
+    for i in range(kmer_size):
+        keys = (keys << np.uint64(BITS_IN_BYTE)) | data[i:(i + count)]
+    return keys
+
+
+def train(samples: list[bytes], size: int, segment_size: int = DEFAULT_SEGMENT_SIZE, kmer_size: int = DEFAULT_KMER_SIZE) -> bytes:
+    '''
+    Builds a dictionary from the segments of `samples` shared by the most samples, a greedy variant of the COVER algorithm.
+    Every k-mer (`kmer_size` consecutive bytes) is scored with the number of samples containing it.
+    The samples are split into one epoch per dictionary segment; from every epoch, the segment with the highest total
+    score of k-mers not covered by a previously selected segment is taken.
+    :param size: Dictionary size (in bytes), usually the window size.
+    :param segment_size: Length of the selected segments (in bytes).
+    :param kmer_size: Length of the scored k-mers (in bytes), at most `MAX_KMER_SIZE`.
+    :return: Dictionary contents, the highest scoring segments last (closest to the data, and kept by smaller windows).
+    '''
+    import numpy as np
+    assert 1 <= kmer_size <= MAX_KMER_SIZE, f'K-mer size out of range [1, {MAX_KMER_SIZE}]: {kmer_size}'
+    assert kmer_size <= segment_size, f'Segment size ({segment_size}) smaller than the k-mer size ({kmer_size})'
+    samples = [sample for sample in samples if len(sample) >= kmer_size]
+    assert samples, f'No sample is at least {kmer_size} bytes long'
+    corpus = b''.join(samples)
+    keys = kmer_keys(np.frombuffer(corpus, dtype=np.uint8), kmer_size)
+    sample_lengths = np.array([len(sample) for sample in samples])
+    sample_indexes = np.repeat(np.arange(len(samples)), sample_lengths)[:len(keys)]
+    # k-mers spanning two samples do not occur in the data
+    sample_ends = np.cumsum(sample_lengths)
+    valid = np.arange(len(keys)) + kmer_size <= sample_ends[sample_indexes]
+    _, key_ids = np.unique(keys, return_inverse=True)
+    key_ids = key_ids.reshape(-1)
+    occurrences = np.unique(key_ids[valid].astype(np.int64) * len(samples) + sample_indexes[valid])
+    scores = np.bincount(occurrences // len(samples), minlength=key_ids.max() + 1).astype(np.int64)
+
+    kmers_per_segment = segment_size - kmer_size + 1
+    epoch_size = max(len(keys) // ceil(size / segment_size), kmers_per_segment)
+    selected = []
+    for epoch_start in range(0, len(keys), epoch_size):
+        ids = key_ids[epoch_start:(epoch_start + epoch_size)]
+        totals = np.concatenate(([0], np.cumsum(np.where(valid[epoch_start:(epoch_start + epoch_size)], scores[ids], 0))))
+        width = min(kmers_per_segment, len(ids))
+        segment_scores = totals[width:] - totals[:-width]
+        best = int(np.argmax(segment_scores))
+        if segment_scores[best] <= 0:
+            continue
+        selected.append((int(segment_scores[best]), epoch_start + best))
+        scores[ids[best:(best + width)]] = 0
+    selected.sort()
+    return b''.join(corpus[start:(start + segment_size)] for _, start in selected)[-size:]
+
+
+def read_samples(paths: list[str]) -> list[bytes]:
+    '''
+    Reads sample files, directories (recursively) and glob patterns.
+    '''
+    samples = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            matches = sorted(glob.glob(path, recursive=True)) if glob.has_magic(path) else [path]
+        for sample_path in matches:
+            if os.path.isfile(sample_path):
+                with open(sample_path, 'rb') as sample_file:
+                    samples.append(sample_file.read())
+    return samples
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='LZSS preset dictionary tool')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help='Train a dictionary from sample files')
+    train_parser.add_argument('samples', nargs='+', help='Sample files, directories or glob patterns')
+    train_parser.add_argument('--output', '-o', default=None, help=f'Dictionary file (target); <ID>{DICTIONARY_SUFFIX} in the current directory by default')
+    train_parser.add_argument('--size', type=int, default=0, help='Dictionary size (in bytes); zero means the window size')
+    train_parser.add_argument('--segment-size', type=int, default=DEFAULT_SEGMENT_SIZE, help='Length of the segments taken from the samples (in bytes)')
+    train_parser.add_argument('--kmer-size', type=int, default=DEFAULT_KMER_SIZE, help=f'Length of the scored k-mers (in bytes, at most {MAX_KMER_SIZE})')
+    train_parser.add_argument('--evaluate', action='store_true', help='Encode every sample with and without the dictionary and report the sizes')
+    add_config_arguments(train_parser)
+    info_parser = subparsers.add_parser('info', help='Print the ID and size of a dictionary')
+    info_parser.add_argument('dictionary_file', type=argparse.FileType('rb'), help='Dictionary file')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        dictionary_id, content = read_dictionary(args.dictionary_file)
+        print(f'Dictionary {dictionary_id:08x}: {len(content)} bytes')
+        sys.exit(0)
+
+    config = config_from_args(args)
+    samples = read_samples(args.samples)
+    content = train(samples, args.size or config.window_size, args.segment_size, args.kmer_size)
+    dictionary_id = make_id(content)
+    output_path = args.output if args.output is not None else f'{dictionary_id:08x}{DICTIONARY_SUFFIX}'
+    with open(output_path, 'wb') as output_file:
+        save_dictionary(output_file, content)
+    print(f'Dictionary {dictionary_id:08x}: {len(content)} bytes from {len(samples)} samples, written to {output_path}', file=sys.stderr)
+    if args.evaluate:
+        # the encoder finds dictionaries through the imported module, which does not share the cache of this script
+        from dictionary import register_dictionary
+        from encoder import encode
+        register_dictionary(content)
+        plain_size = sum(len(encode(sample, LzssConfig(**{**vars(config), 'dictionary_id': 0}))) for sample in samples if sample)
+        preset_size = sum(len(encode(sample, LzssConfig(**{**vars(config), 'dictionary_id': dictionary_id}))) for sample in samples)
+        print(f'Encoded samples: {plain_size} bytes without the dictionary, {preset_size} bytes with it', file=sys.stderr)
@@ -0,0 +1,215 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import sys
+import zlib
+
+from container import write_container
+from decoder import BITS_IN_BYTE, LzssConfig, add_config_arguments, code_word_widths, config_from_args, preset_window
+
+DEFAULT_CHAIN_DEPTH = 32
+DEFAULT_LAZY_LEVEL = 1
+MAX_HASH_BYTES = 3
+BITS_TO_WRITE_AT_ONCE = 256
+BYTES_TO_COMPARE_AT_ONCE = 8
+
+
+class BitWriter:
+    '''
+    Big endian bit writer, the counterpart of `BitReader`.
+    Bits are collected in a small integer accumulator and converted to bytes in whole words.
+    '''
+    def __init__(self):
+        self._chunks = []
+        self._accumulator = 0
+        self._accumulator_bits = 0
+
+    def write(self, value: int, length: int):
+        self._accumulator = (self._accumulator << length) | value
+        self._accumulator_bits += length
+        if self._accumulator_bits >= BITS_TO_WRITE_AT_ONCE:
+            self._drain()
+
+    def _drain(self):
+        byte_count = self._accumulator_bits // BITS_IN_BYTE
+        remaining_bits = self._accumulator_bits - byte_count * BITS_IN_BYTE
+        self._chunks.append((self._accumulator >> remaining_bits).to_bytes(byte_count, 'big'))
+        self._accumulator &= (1 << remaining_bits) - 1
+        self._accumulator_bits = remaining_bits
+
+    def getvalue(self) -> tuple[bytes, int]:
+        '''
+        Pads the stream with zero bits up to a whole byte.
+        :return: Written bytes and the number of padding bits.
+        '''
+        padding = -self._accumulator_bits % BITS_IN_BYTE
+        self.write(0, padding)
+        self._drain()
+        return b''.join(self._chunks), padding
+
+
+def match_length(buffer: bytes, a: int, b: int, limit: int, step: int = BYTES_TO_COMPARE_AT_ONCE) -> int:
+    '''
+    Counts equal bytes at positions `a` and `b` of `buffer`, comparing whole words first.
+    :param limit: Maximum length.
+    :param step: Bytes compared at once before single bytes; larger steps pay off for long matches.
+    :return: Length of the common prefix, at most `limit`.
+    '''
+    length = 0
+    while length + step <= limit and buffer[(a + length):(a + length + step)] == buffer[(b + length):(b + length + step)]:
+        length += step
+    while length < limit and buffer[a + length] == buffer[b + length]:
+        length += 1
+    return length
+
+
+def min_match_length(config: LzssConfig) -> int:
+    '''
+    :return: Shortest reference taking fewer bits than the literals it replaces.
+    '''
+    _, _, literal_code_word_width, reference_code_word_width = code_word_widths(config)
+    return max(config.length_bias, reference_code_word_width // literal_code_word_width + 1)
+
+
+def encode(data: bytes, config: LzssConfig, chain_depth: int = DEFAULT_CHAIN_DEPTH, lazy_level: int = DEFAULT_LAZY_LEVEL) -> bytes:
+    '''
+    Encodes `data` into the raw stream layout read by `decode`.
+    Matches are found with hash chains over the sliding window: every position is linked to the previous one
+    starting with the same bytes, and at most `chain_depth` candidates are compared per position.
+    With `lazy_level` above zero, a match is deferred by up to that many positions when the next position matches longer.
+    :param data: Source bytes.
+    :param config: Encoder configuration, the decoder has to use the same one.
+    :param chain_depth: Maximum number of match candidates compared per position.
+    :param lazy_level: Maximum number of positions a match can be deferred by.
+    :return: Encoded stream.
+    '''
+    preset = preset_window(config)
+    assert len(data) > 0 or preset is not None, 'Cannot encode empty input: the stream has to start with a literal'
+    min_code_word_width, _, literal_code_word_width, reference_code_word_width = code_word_widths(config)
+    window_size = config.window_size
+    flag_width = config.flag_width
+    distance_width = config.distance_width
+    length_width = config.length_width
+    length_bias = config.length_bias
+    literal_flag = 0 if config.flag_zero_means_literal else 1
+    reference_flag = 1 if config.flag_zero_means_literal else 0
+    max_length = min((1 << length_width) - 1 + length_bias, window_size)
+    min_length = min_match_length(config)
+    max_distance = 1 << distance_width
+    hash_bytes = min(MAX_HASH_BYTES, min_length)
+
+    # the window starts preloaded from the preset dictionary or filled with the first character, exactly as in `start_window`
+    buffer = (preset if preset is not None else bytes([data[0]]) * window_size) + data
+    end = len(buffer)
+    head = {}
+    previous = [-1] * window_size
+    inserted = 0
+
+    def insert_up_to(position: int):
+        nonlocal inserted
+        for k in range(inserted, min(position, end - hash_bytes + 1)):
+            key = buffer[k:(k + hash_bytes)]
+            previous[k % window_size] = head.get(key, -1)
+            head[key] = k
+        inserted = max(inserted, position)
+
+    def find(position: int) -> tuple[int, int]:
+        insert_up_to(position)
+        if position + hash_bytes > end:
+            return 0, 0
+        window_start = position - window_size
+        best_length, best_start = 0, 0
+        candidate = head.get(buffer[position:(position + hash_bytes)], -1)
+        depth = chain_depth
+        while candidate >= window_start and depth > 0:
+            depth -= 1
+            # references never read past the newest byte of the window
+            limit = min(max_length, position - candidate, end - position)
+            if limit > best_length and buffer[candidate + best_length] == buffer[position + best_length]:
+                logical_start = candidate - window_start
+                distance = window_size - 1 - logical_start if config.distance_from_end else logical_start
+                if distance < max_distance:
+                    length = match_length(buffer, candidate, position, limit)
+                    if length > best_length:
+                        best_length, best_start = length, candidate
+                        if length == max_length:
+                            break
+            next_candidate = previous[candidate % window_size]
+            if next_candidate >= candidate:
+                break
+            candidate = next_candidate
+        return best_length, best_start
+
+    writer = BitWriter()
+    write = writer.write
+    position = window_size
+    if preset is None:
+        write(literal_flag, flag_width)
+        write(data[0], BITS_IN_BYTE)
+        position += 1
+    while position < end:
+        length, start = find(position)
+        deferred = 0
+        while length >= min_length and length < max_length and deferred < lazy_level and position + 1 < end:
+            next_length, next_start = find(position + 1)
+            if next_length <= length:
+                break
+            write(literal_flag, flag_width)
+            write(buffer[position], BITS_IN_BYTE)
+            position += 1
+            length, start = next_length, next_start
+            deferred += 1
+        if length >= min_length:
+            logical_start = start - (position - window_size)
+            write(reference_flag, flag_width)
+            write(window_size - 1 - logical_start if config.distance_from_end else logical_start, distance_width)
+            write(length - length_bias, length_width)
+            position += length
+        else:
+            write(literal_flag, flag_width)
+            write(buffer[position], BITS_IN_BYTE)
+            position += 1
+
+    encoded, padding = writer.getvalue()
+    assert padding < min_code_word_width, f'Padding ({padding} bits) would be decoded as a code word, code words need at least {min_code_word_width} bits for this configuration'
+    return encoded
+
+
+def encode_blocks(data: bytes, config: LzssConfig, block_size: int, chain_depth: int = DEFAULT_CHAIN_DEPTH, lazy_level: int = DEFAULT_LAZY_LEVEL, workers: int = 1) -> list[tuple[bytes, int, int]]:
+    '''
+    Splits `data` into independently encoded blocks for a framed container.
+    :param block_size: Decoded size of every block but the last one (in bytes).
+    :param workers: Number of worker processes; 1 encodes in the current process.
+    :return: Triples of (encoded block, decoded size in bytes, CRC32 of the decoded block), as taken by `write_container`.
+    '''
+    pieces = [data[i:(i + block_size)] for i in range(0, len(data), block_size)]
+    arguments = (pieces, repeat(config), repeat(chain_depth), repeat(lazy_level))
+    if workers <= 1:
+        encoded = list(map(encode, *arguments))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            encoded = list(executor.map(encode, *arguments))
+    return [(payload, len(piece), zlib.crc32(piece)) for payload, piece in zip(encoded, pieces)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LZSS sliding window encoder')
+    parser.add_argument('input_file', type=argparse.FileType('rb'), nargs='?', help='Input file (to be encoded)')
+    parser.add_argument('output_file', type=argparse.FileType('wb'), nargs='?', help='Output file (target)')
+    add_config_arguments(parser)
+    parser.add_argument('--chain-depth', type=int, default=DEFAULT_CHAIN_DEPTH, help='Maximum number of match candidates compared per position')
+    parser.add_argument('--lazy-level', type=int, default=DEFAULT_LAZY_LEVEL, help='Maximum number of positions a match can be deferred by; zero means greedy')
+    parser.add_argument('--block-size', type=int, default=0, help='Write a framed container with blocks of this decoded size (in bytes); zero means a raw stream')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for encoding container blocks')
+    parser.add_argument('--no-checksums', action='store_true', help='Write containers without block checksums (version 1)')
+    args = parser.parse_args()
+
+    input_file = args.input_file if args.input_file is not None else sys.stdin.buffer
+    output_file = args.output_file if args.output_file is not None else sys.stdout.buffer
+    config = config_from_args(args)
+    data = input_file.read()
+    if args.block_size > 0:
+        written = write_container(output_file, config, encode_blocks(data, config, args.block_size, args.chain_depth, args.lazy_level, args.workers), not args.no_checksums)
+    else:
+        written = output_file.write(encode(data, config, args.chain_depth, args.lazy_level))
+    print(f'Compressed {len(data)} bytes into {written} bytes.', file=sys.stderr)
@@ -1,10 +1,22 @@
+import hashlib
 import io
+import json
+from itertools import repeat
 import math
 import os
 import sys
-import matplotlib.pyplot as plt
+import time
+from typing import TYPE_CHECKING
 import numpy as np
 
+# Matplotlib takes longer to import than everything else together, it is only imported when something is drawn.
+if TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), ".cache", "histogram.json")
+CACHE_MAX_ENTRIES = 1024
+CHUNK_SIZE = 1 << 24
+
 
 def validate_header(file: io.BufferedReader) -> tuple[tuple[int, int], int]:
     """
@@ -56,45 +68,325 @@ def read_file(path: str) -> tuple[np.ndarray, tuple[int, int], int]:
     return data, dimensions, max
 
 
-def calculate_entropy(sums: list[int], total: int) -> float:
+def calculate_entropy(sums: list[int] | np.ndarray, total: int) -> float:
     """
     Calculate entropy of dataset processed into a histogram.
 
     :param sums: Counts of specific sample values.
-    :type sums: list[int]
+    :type sums: list[int] | np.ndarray
     :param total: Total sample count.
     :type total: int
     :return: Entropy value.
     :rtype: float
     """
-    entropy = 0
-    for sum in sums:
-        probability = sum / total
-        if probability != 0:
-            entropy -= probability * math.log2(probability)
-    return entropy
+    probabilities = np.asarray(sums, dtype=np.float64) / total
+    probabilities = probabilities[probabilities != 0]
+    # A single symbol gives -(1 * log2(1)), negative zero.
+    return max(0.0, float(-np.sum(probabilities * np.log2(probabilities))))
+
 
+def block_keys(data: np.ndarray, order_number: int) -> np.ndarray:
+    """
+    Pack every block of `order_number` consecutive samples into a single key.
+    Up to 8 samples are packed into a 64 bit integer, longer blocks are kept as raw byte strings.
 
-def calculate_n_order(data: np.ndarray, order_number: int) -> tuple[list[int], int]:
+    :param data: Input data, unsigned 8 bit integers.
+    :type data: np.ndarray
+    :param order_number: Block length.
+    :type order_number: int
+    :return: Keys of all len(data) - order_number + 1 blocks, in order.
+    :rtype: np.ndarray
     """
-    TODO: Summary
+    block_count = len(data) - order_number + 1
+    if order_number > 8:
+        blocks = np.ascontiguousarray(np.lib.stride_tricks.sliding_window_view(data, order_number))
+        return blocks.view(np.dtype((np.void, order_number))).ravel()
+    keys = np.zeros(block_count, dtype=np.uint64)
+    for offset in range(order_number):
+        keys <<= np.uint64(8)
+        keys |= data[offset:offset + block_count]
+    return keys
+
+
+def calculate_n_order(data: np.ndarray, order_number: int) -> tuple[np.ndarray, int]:
+    """
+    Count occurrences of every block of `order_number` consecutive samples.
 
     :param data: Input data.
     :type data: np.ndarray
     :param order_number: Order of block source.
     :type order_number: int
-    :return: TODO: Return summary
-    :rtype: tuple[list[int], int]
+    :return: Counts of the distinct blocks and the total block count.
+    :rtype: tuple[np.ndarray, int]
     """
-    block_pairs: dict[int, int] = {}
-    total_pairs = len(data) - order_number
-    for i in range(total_pairs):
-        key = data[i:i+order_number]
-        block_pairs[key] = block_pairs[key] + 1 if key in block_pairs else 1
-    return list(block_pairs.values()), total_pairs
+    total_blocks = len(data) - order_number + 1
+    if total_blocks <= 0:
+        return np.zeros(0, dtype=np.int64), 0
+    if order_number <= 2:
+        # small alphabets are counted directly
+        return np.bincount(block_keys(data, order_number).astype(np.int64), minlength=256 ** order_number), total_blocks
+    _, counts = np.unique(block_keys(data, order_number), return_counts=True)
+    return counts, total_blocks
 
 
-def process_file(dir: str, name: str, axis: plt.Axes) -> tuple[float, float, float]:
+class BlockCounter:
+    """
+    Incremental counterpart of `calculate_n_order`.
+
+    Feeding consecutive parts of the data, each preceded by the last `order_number - 1` samples of the previous part,
+    gives the same counts as `calculate_n_order` on the whole data. Memory is bounded by the count table.
+    """
+
+    def __init__(self, order_number: int):
+        self.order_number = order_number
+        self.total = 0
+        self._keys = None
+        self._counts = np.zeros(256 ** order_number if order_number <= 2 else 0, dtype=np.int64)
+
+    def update(self, data: np.ndarray) -> None:
+        """
+        Count all blocks in `data`.
+
+        :param data: Input data, including context from the previous part.
+        :type data: np.ndarray
+        """
+        block_count = len(data) - self.order_number + 1
+        if block_count <= 0:
+            return
+        self.total += block_count
+        if self.order_number <= 2:
+            self._counts += np.bincount(block_keys(data, self.order_number).astype(np.int64), minlength=len(self._counts))
+            return
+        keys, counts = np.unique(block_keys(data, self.order_number), return_counts=True)
+        if self._keys is not None:
+            # Merge with the running table, keeping keys sorted like `np.unique` on the whole data would.
+            keys, inverse = np.unique(np.concatenate((self._keys, keys)), return_inverse=True)
+            counts = np.bincount(inverse.ravel(), weights=np.concatenate((self._counts, counts)), minlength=len(keys)).astype(np.int64)
+        self._keys, self._counts = keys, counts
+
+    def counts(self) -> tuple[np.ndarray, int]:
+        """
+        :return: Counts of the distinct blocks and the total block count, as returned by `calculate_n_order`.
+        :rtype: tuple[np.ndarray, int]
+        """
+        if self.total == 0:
+            return np.zeros(0, dtype=np.int64), 0
+        return self._counts, self.total
+
+
+def stream_file(path: str, max_order: int = 3, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Calculate the same statistics as `analyze_file`, reading the file in chunks of `chunk_size` samples.
+    Block context is carried across chunk boundaries, so inputs larger than memory can be profiled.
+
+    :param path: String path to the file.
+    :type path: str
+    :param max_order: Highest block order to calculate entropy for.
+    :type max_order: int
+    :param chunk_size: Samples read at once.
+    :type chunk_size: int
+    :return: Dictionary with the histogram, maximum sample value and entropy for block orders 1 to `max_order`.
+    :rtype: dict
+    """
+    counters = [BlockCounter(order_number) for order_number in range(1, max_order + 1)]
+    context = np.zeros(0, dtype=np.uint8)
+    with open(os.path.dirname(__file__) + "/" + path, "rb") as file:
+        # Validate header, extract dimension and maximum value information.
+        dimensions, max_value = validate_header(file)
+        while chunk := file.read(chunk_size):
+            data = np.concatenate((context, np.frombuffer(chunk, dtype=np.uint8)))
+            for counter in counters:
+                # Only blocks ending in the new chunk, the rest was counted with the previous one.
+                counter.update(data[max(0, len(context) - counter.order_number + 1):])
+            context = data[len(data) - min(len(data), max_order - 1):]
+    # Trim the histogram like `np.bincount(data, minlength=max_value + 1)` would.
+    sums = counters[0]._counts
+    sums = sums[:int(np.max(np.nonzero(sums)[0], initial=max_value)) + 1]
+    entropy = calculate_entropy(sums, dimensions[0] * dimensions[1])
+    block_entropies = [calculate_entropy(*counter.counts()) for counter in counters[1:]]
+    return {"histogram": sums.tolist(), "max": max_value, "entropies": [entropy] + block_entropies}
+
+
+def analyze_file(path: str, max_order: int = 3, chunk_size: int = 0) -> dict:
+    """
+    Calculate the histogram and entropy of a file, without drawing anything.
+    Runs in worker processes, so it only returns plain data.
+
+    :param path: String path to the file.
+    :type path: str
+    :param max_order: Highest block order to calculate entropy for.
+    :type max_order: int
+    :param chunk_size: Read the file in chunks of this many samples (see `stream_file`); 0 loads it whole.
+    :type chunk_size: int
+    :return: Dictionary with the histogram, maximum sample value and entropy for block orders 1 to `max_order`.
+    :rtype: dict
+    """
+    if chunk_size > 0:
+        return stream_file(path, max_order, chunk_size)
+    data, dimensions, max = read_file(path)
+    sums = np.bincount(data, minlength=max + 1)
+    entropy = calculate_entropy(sums, dimensions[0] * dimensions[1])
+    # Calculate higher order (block) entropy
+    block_entropies = [
+        calculate_entropy(*calculate_n_order(data, order_number))
+        for order_number in range(2, max_order + 1)
+    ]
+    return {"histogram": sums.tolist(), "max": max, "entropies": [entropy] + block_entropies}
+
+
+def file_digest(path: str) -> str:
+    """
+    Calculate SHA-256 of the file content.
+
+    :param path: String path to the file (relative to this script).
+    :type path: str
+    :return: Hex digest.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(os.path.dirname(__file__) + "/" + path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StatisticsCache:
+    """
+    On-disk cache of `analyze_file` results.
+
+    Entries are keyed by file path and validated by size and modification time; when only the modification time
+    changed, the content hash decides. Entries for missing files are dropped on save and the least recently used
+    ones are evicted above `max_entries`.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self._path = path
+        self._max_entries = max_entries
+        self._entries: dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as file:
+                    self._entries = json.load(file)
+            except (OSError, ValueError):
+                # A damaged cache is only a performance problem, start over.
+                self._entries = {}
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(os.path.dirname(__file__) + "/" + path)
+
+    def get(self, path: str, max_order: int) -> dict | None:
+        """
+        Look up statistics for a file, if the cached entry is still valid.
+
+        :param path: String path to the file.
+        :type path: str
+        :param max_order: Highest block order required.
+        :type max_order: int
+        :return: Cached statistics or None.
+        :rtype: dict | None
+        """
+        entry = self._entries.get(self._key(path))
+        if entry is None or entry["max_order"] < max_order:
+            return None
+        stat = os.stat(self._key(path))
+        if stat.st_size != entry["size"]:
+            return None
+        if stat.st_mtime_ns != entry["mtime"]:
+            if file_digest(path) != entry["digest"]:
+                return None
+            entry["mtime"] = stat.st_mtime_ns
+        entry["used"] = time.time()
+        statistics = dict(entry["statistics"])
+        statistics["entropies"] = statistics["entropies"][:max_order]
+        return statistics
+
+    def put(self, path: str, max_order: int, statistics: dict) -> None:
+        """
+        Store statistics for a file.
+
+        :param path: String path to the file.
+        :type path: str
+        :param max_order: Highest block order the statistics contain.
+        :type max_order: int
+        :param statistics: Result of `analyze_file`.
+        :type statistics: dict
+        """
+        stat = os.stat(self._key(path))
+        self._entries[self._key(path)] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "digest": file_digest(path),
+            "max_order": max_order,
+            "used": time.time(),
+            "statistics": statistics,
+        }
+
+    def save(self) -> None:
+        """
+        Evict stale and least recently used entries and write the cache to disk.
+        """
+        entries = {key: entry for key, entry in self._entries.items() if os.path.exists(key)}
+        newest = sorted(entries.items(), key=lambda item: item[1]["used"], reverse=True)[:self._max_entries]
+        self._entries = dict(newest)
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path, "w") as file:
+            json.dump(self._entries, file)
+
+
+def analyze_files(paths: list[str], max_order: int = 3, workers: int = 1, cache: StatisticsCache | None = None, chunk_size: int = 0) -> list[dict]:
+    """
+    Calculate statistics for many files, reusing cached results and spreading the rest across processes.
+
+    :param paths: String paths to the files.
+    :type paths: list[str]
+    :param max_order: Highest block order to calculate entropy for.
+    :type max_order: int
+    :param workers: Number of worker processes; 1 analyzes files in the current process.
+    :type workers: int
+    :param cache: Optional statistics cache.
+    :type cache: StatisticsCache | None
+    :param chunk_size: Read files in chunks of this many samples; 0 loads them whole.
+    :type chunk_size: int
+    :return: Statistics for every file, in the order of `paths`.
+    :rtype: list[dict]
+    """
+    results = [cache.get(path, max_order) if cache is not None else None for path in paths]
+    missing = [path for path, result in zip(paths, results) if result is None]
+    if workers > 1 and len(missing) > 1:
+        # Imported here: a single or cached file is analyzed without a pool.
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(min(workers, len(missing))) as executor:
+            computed = list(executor.map(analyze_file, missing, repeat(max_order), repeat(chunk_size)))
+    else:
+        computed = [analyze_file(path, max_order, chunk_size) for path in missing]
+    computed = iter(computed)
+    for i, (path, result) in enumerate(zip(paths, results)):
+        if result is None:
+            results[i] = next(computed)
+            if cache is not None:
+                cache.put(path, max_order, results[i])
+    return results
+
+
+def plot_histogram(axis: "plt.Axes", name: str, statistics: dict) -> None:
+    """
+    Draw a histogram from precomputed statistics.
+
+    :param axis: PyPlot axis to draw to.
+    :type axis: plt.Axes
+    :param name: Subplot name.
+    :type name: str
+    :param statistics: Result of `analyze_file`.
+    :type statistics: dict
+    """
+    histogram = statistics["histogram"]
+    axis.stairs(histogram, np.arange(len(histogram) + 1), fill=True)
+    axis.set_title(name)
+    axis.set_xlim(0, statistics["max"])
+
+
+def process_file(dir: str, name: str, axis: "plt.Axes", max_order: int = 3) -> tuple[float, ...]:
     """
     Given relative path to the file, process its content, draw a histogram and calculate entropy.
 
@@ -104,51 +396,71 @@ def process_file(dir: str, name: str, axis: plt.Axes) -> tuple[float, float, flo
     :type name: str
     :param axis: PyPlot axis to draw to.
     :type axis: plt.Axes
-    :return: Calculated entropy of the dataset.
-    :rtype: tuple[float, float, float]
+    :param max_order: Highest block order to calculate entropy for.
+    :type max_order: int
+    :return: Calculated entropy of the dataset, for block orders 1 to `max_order`.
+    :rtype: tuple[float, ...]
     """
-    data, dimensions, max = read_file(dir + name)
-    # Save bars from the histogram
-    _, _, bars = axis.hist(data, bins=max+1, range=(0, max))
-    axis.set_title(name)
-    axis.set_xlim(0, max)
-    # Extract bar values and calculate entropy
-    sums = [bar.get_height() for bar in bars]
-    entropy = calculate_entropy(sums, dimensions[0] * dimensions[1])
-    # Calculate second order entropy
-    second_sums, second_total = calculate_n_order(data, 2)
-    second_entropy = calculate_entropy(second_sums, second_total)
-    # Calculate third order entropy
-    third_sums, third_total = calculate_n_order(data, 3)
-    third_entropy = calculate_entropy(third_sums, third_total)
-    return entropy, second_entropy, third_entropy
+    statistics = analyze_file(dir + name, max_order)
+    plot_histogram(axis, name, statistics)
+    return tuple(statistics["entropies"])
+
+
+def list_pgm_files(path: str) -> list[str]:
+    """
+    List PGM files in a directory, skipping subdirectories and other files.
+
+    :param path: String path to the directory.
+    :type path: str
+    :return: Sorted list of file names.
+    :rtype: list[str]
+    """
+    directory = os.path.dirname(__file__) + "/" + path
+    return sorted(
+        name for name in os.listdir(directory)
+        if name.endswith(".pgm") and os.path.isfile(os.path.join(directory, name))
+    )
 
 
-def process_folder(path: str) -> list[tuple[str, float]]:
+def process_folder(path: str, max_order: int = 3, workers: int = 1, cache: StatisticsCache | None = None, chunk_size: int = 0, plot: bool = True) -> list[tuple[str, tuple[float, ...]]]:
     """
     Given relative path to a directory, process all files inside and create a rectangular plot grid with histograms.
+    Statistics are calculated (or taken from the cache) for all files first, plots are drawn afterwards.
 
     :param path: String path to the directory.
     :type path: str
-    :return: List of pairs (file name, entropy).
-    :rtype: list[tuple[str, float]]
+    :param max_order: Highest block order to calculate entropy for.
+    :type max_order: int
+    :param workers: Number of worker processes.
+    :type workers: int
+    :param cache: Optional statistics cache.
+    :type cache: StatisticsCache | None
+    :param chunk_size: Read files in chunks of this many samples; 0 loads them whole.
+    :type chunk_size: int
+    :param plot: Draw the histograms; without plotting, Matplotlib is not imported.
+    :type plot: bool
+    :return: List of pairs (file name, entropies).
+    :rtype: list[tuple[str, tuple[float, ...]]]
     """
-    entropies = []
-    # Obtain a list of all files in a directory.
-    files = os.listdir(os.path.dirname(__file__) + "/" + path)
+    # Obtain a list of all PGM files in a directory.
+    files = list_pgm_files(path)
+    print(f"Processing {len(files)} files...")
+    statistics = analyze_files([path + file for file in files], max_order, workers, cache, chunk_size)
+    entropies = [(file, tuple(file_statistics["entropies"])) for file, file_statistics in zip(files, statistics)]
+    if not plot:
+        return entropies
+    import matplotlib.pyplot as plt
     # Calculate an optimal (or rather, good enough) grid shape for axes.
     grid_shape = math.ceil(math.sqrt(len(files))), round(math.sqrt(len(files)))
     # Create figure and axes of given shape.
-    fig, axes = plt.subplots(*grid_shape)
-    # Process each file sequentially and assign its histogram to an axis.
-    for file, i in zip(files, range(len(files))):
-        print(f"Processing file #{i + 1}: {file}...")
-        entropy_set = process_file(path, file, axes[i // grid_shape[1]][i % grid_shape[1]])
-        entropies.append((file, entropy_set))
+    fig, axes = plt.subplots(*grid_shape, squeeze=False)
+    # Assign each histogram to an axis.
+    for i, (file, file_statistics) in enumerate(zip(files, statistics)):
+        plot_histogram(axes[i // grid_shape[1]][i % grid_shape[1]], file, file_statistics)
     return entropies
 
 
-def create_hist(path: str, file_name: str) -> None:
+def create_hist(path: str, file_name: str, statistics: dict | None = None, save_dir: str = "histograms") -> None:
     """
     Create and save a  histogram for a file in the given folder.
 
@@ -156,49 +468,89 @@ def create_hist(path: str, file_name: str) -> None:
     :type path: str
     :param file_name: File name.
     :type file_name: str
+    :param statistics: Precomputed statistics, calculated when not given.
+    :type statistics: dict | None
+    :param save_dir: Directory to save the image to.
+    :type save_dir: str
     """
-    data, dimensions, max = read_file(os.path.join(path, file_name))
-    plt.figure()
-    plt.hist(data, bins=max, range=(0, max))
-    plt.title(file_name)
-    save_name =  os.path.join("py", "histograms", os.path.splitext(file_name)[0] + ".png")
+    import matplotlib.pyplot as plt
+    if statistics is None:
+        statistics = analyze_file(os.path.join(path, file_name), 1)
+    figure = plt.figure()
+    plot_histogram(figure.gca(), file_name, statistics)
+    os.makedirs(save_dir, exist_ok=True)
+    save_name = os.path.join(save_dir, os.path.splitext(file_name)[0] + ".png")
     plt.savefig(save_name)
-    
+    plt.close(figure)
 
-def hist_for_files(path: str) -> None:
+
+def hist_for_files(path: str, workers: int = 1, cache: StatisticsCache | None = None, save_dir: str = "histograms") -> None:
     """
     Create and save a separate histogram for every file in the folder.
 
     :param path: String path to the directory.
     :type path: str
+    :param workers: Number of worker processes.
+    :type workers: int
+    :param cache: Optional statistics cache.
+    :type cache: StatisticsCache | None
+    :param save_dir: Directory to save the images to.
+    :type save_dir: str
     """
-    # Obtain a list of all files in a directory.
-    files = os.listdir(os.path.dirname(__file__) + "/" + path)
-    # Process each file sequentially and show and save the histogram for it.
-    for i, file in enumerate(files):
+    # Obtain a list of all PGM files in a directory.
+    files = list_pgm_files(path)
+    statistics = analyze_files([os.path.join(path, file) for file in files], 1, workers, cache)
+    # Show and save the histogram for each file.
+    for i, (file, file_statistics) in enumerate(zip(files, statistics)):
         print(f"Generating histogram and saving it #{i + 1}: {file}...")
-        create_hist(path, file)
+        create_hist(path, file, file_statistics, save_dir)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        for filename in sys.argv[1:]:
-            axes = plt.axes()
-            entropy = process_file('', filename, axes)
-            print(f'Entropy for file {filename}: {entropy:.3f}')
-            plt.show()
-        exit()
-    results = []
-    dirs = ["../data/txt/", "../data/img/", "../data/random/"]
-    ## Calculate normal, second- and third- block order entropy values for files
-    for dir in dirs:
-        print(f"Processing folder {dir}...")
-        entropies = process_folder(dir)
-        results.extend(entropies)
-    print("Entropy values:")
-    for file, entropy in results:
-        print(f"File {file}: \tEntropy {round(entropy[0],3)} \t| Entropy second {round(entropy[1],3)} \t| Entropy third {round(entropy[2],3)}")
-    ## Create separate histograms for each file
-    #for dir in dirs:
-    #    hist_for_files(dir)
-    plt.show()
+    import argparse
+    parser = argparse.ArgumentParser(description="Histograms and block entropy of PGM files")
+    parser.add_argument("files", nargs="*", help="Files to process (relative to this script); all of data/ when omitted")
+    parser.add_argument("--max-order", type=int, default=3, help="Highest block order to calculate entropy for")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes for calculating statistics")
+    parser.add_argument("--no-cache", action="store_true", help="Recalculate everything instead of using the statistics cache")
+    parser.add_argument("--cache-file", default=CACHE_PATH, help="Statistics cache location")
+    parser.add_argument("--chunk-size", type=int, default=0, help="Read files in chunks of this many samples, for inputs larger than memory; 0 loads them whole")
+    parser.add_argument("--backend", default=None, help="Matplotlib backend, e.g. Agg for headless runs")
+    parser.add_argument("--save-dir", default=None, help="Save figures to this directory instead of showing them")
+    parser.add_argument("--no-plot", action="store_true", help="Only print entropy values, without drawing histograms (Matplotlib is not imported)")
+    args = parser.parse_args()
+
+    if not args.no_plot:
+        import matplotlib.pyplot as plt
+    if args.backend is not None and not args.no_plot:
+        plt.switch_backend(args.backend)
+    cache = None if args.no_cache else StatisticsCache(args.cache_file)
+    if args.files:
+        for filename, statistics in zip(args.files, analyze_files(args.files, args.max_order, args.workers, cache, args.chunk_size)):
+            if not args.no_plot:
+                plot_histogram(plt.figure().gca(), filename, statistics)
+            print(f'Entropy for file {filename}: {" | ".join(f"{value:.3f}" for value in statistics["entropies"])}')
+    else:
+        results = []
+        dirs = ["../data/txt/", "../data/img/", "../data/random/"]
+        ## Calculate normal and higher block order entropy values for files
+        for dir in dirs:
+            print(f"Processing folder {dir}...")
+            entropies = process_folder(dir, args.max_order, args.workers, cache, args.chunk_size, not args.no_plot)
+            results.extend(entropies)
+        print("Entropy values:")
+        for file, entropy in results:
+            print(f"File {file}: \t" + " \t| ".join(f"Entropy order {order} {round(value, 3)}" for order, value in enumerate(entropy, start=1)))
+        ## Create separate histograms for each file
+        #for dir in dirs:
+        #    hist_for_files(dir, args.workers, cache)
+    if cache is not None:
+        cache.save()
+    if args.no_plot:
+        sys.exit(0)
+    if args.save_dir is not None:
+        os.makedirs(args.save_dir, exist_ok=True)
+        for number in plt.get_fignums():
+            plt.figure(number).savefig(os.path.join(args.save_dir, f"figure_{number}.png"))
+    else:
+        plt.show()
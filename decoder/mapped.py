@@ -0,0 +1,76 @@
+import mmap
+from typing import BinaryIO
+
+from container import HEADER_SIZE, ChecksumWriter, CorruptBlockError, check_decoded, check_payload, is_container_header, read_header
+from decoder import LzssConfig, decode_buffer
+
+
+def container_output_size(input_map: mmap.mmap, container: bool | None = None) -> int | None:
+    '''
+    :param container: Whether the input is a framed container; None detects it from the header.
+    :return: Decoded size recorded in a container header, or None for raw streams.
+    '''
+    if not (container if container is not None else is_container_header(input_map[:HEADER_SIZE])):
+        return None
+    input_map.seek(0)
+    _, blocks = read_header(input_map)
+    return sum(block.decoded_size for block in blocks)
+
+
+def decode_map(input_map: mmap.mmap, output_file: BinaryIO | mmap.mmap, config: LzssConfig, container: bool | None = None) -> int:
+    '''
+    Decodes a raw stream or a framed container from a memory-mapped input, reading it in place.
+    Container blocks are checked against their checksums before and after decoding.
+    :param config: Decoder configuration; ignored for containers, which record their own.
+    :param container: Whether the input is a framed container; None detects it from the header.
+    :return: Number of bytes written.
+    '''
+    start = output_file.tell()
+    with memoryview(input_map) as view:
+        if not (container if container is not None else is_container_header(input_map[:HEADER_SIZE])):
+            decode_buffer(view, output_file, config)
+            return output_file.tell() - start
+        input_map.seek(0)
+        container_config, blocks = read_header(input_map)
+        for block in blocks:
+            with view[block.offset:(block.offset + block.compressed_size)] as payload:
+                check_payload(block, payload)
+                checksum_writer = ChecksumWriter(output_file)
+                decode_buffer(payload, checksum_writer, LzssConfig(**vars(container_config)))
+            check_decoded(block, checksum_writer.size, checksum_writer.checksum)
+    return output_file.tell() - start
+
+
+def decode_mapped(input_path: str, output_path: str, config: LzssConfig, output_size: int = 0, container: bool | None = None) -> int:
+    '''
+    Decodes `input_path` into `output_path`, reading the input through a memory map.
+    When the output size is known (from a container header or `output_size`), the output file is preallocated
+    and written through a memory map as well, otherwise it is written in large blocks.
+    Either way, memory use does not grow with the size of the input.
+    :param output_size: Expected decoded size (in bytes), zero means unknown; ignored for containers.
+    :param container: Whether the input is a framed container; None detects it from the header.
+    :return: Number of bytes written.
+    '''
+    with open(input_path, 'rb') as input_file, \
+            mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as input_map:
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            input_map.madvise(mmap.MADV_SEQUENTIAL)
+        if container is None:
+            container = is_container_header(input_map[:HEADER_SIZE])
+        output_size = container_output_size(input_map, container) or output_size
+        if not output_size:
+            with open(output_path, 'wb') as output_file:
+                return decode_map(input_map, output_file, config, container)
+
+        with open(output_path, 'w+b') as output_file:
+            output_file.truncate(output_size)
+            with mmap.mmap(output_file.fileno(), output_size, access=mmap.ACCESS_WRITE) as output_map:
+                try:
+                    written = decode_map(input_map, output_map, config, container)
+                except CorruptBlockError:
+                    raise
+                except ValueError as error:
+                    raise AssertionError(f'Decoded output exceeds the expected size of {output_size} bytes') from error
+            # a size hint larger than the actual output would leave zeros behind
+            output_file.truncate(written)
+            return written
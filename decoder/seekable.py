@@ -0,0 +1,152 @@
+import argparse
+from bisect import bisect_right
+from dataclasses import dataclass
+import struct
+import sys
+from typing import BinaryIO
+
+from container import CONFIG_FORMAT, DICTIONARY_ID_FORMAT, DICTIONARY_ID_SIZE, OPTION_PRESET_DICTIONARY, pack_config, unpack_config
+from decoder import BITS_IN_BYTE, BYTES_TO_PARSE_AT_ONCE, BitReader, LzssConfig, LzssDecoder, add_config_arguments, code_word_batches, config_from_args, decode_code_words, start_window
+
+INDEX_MAGIC = b'LZSI'
+INDEX_VERSION = 1
+INDEX_HEADER_FORMAT = '>4sB' + CONFIG_FORMAT[1:] + 'QQI'
+INDEX_HEADER_SIZE = struct.calcsize(INDEX_HEADER_FORMAT)
+# the dictionary ID follows the header when the configuration uses a preset dictionary, as in containers
+CHECKPOINT_FORMAT = '>QQ'
+CHECKPOINT_SIZE = struct.calcsize(CHECKPOINT_FORMAT)
+
+DEFAULT_CHECKPOINT_INTERVAL = 1 << 20
+
+
+@dataclass
+class Checkpoint:
+    input_bit_offset: int  # bits, position of the next code word
+    output_position: int  # bytes decoded before the checkpoint
+    window: bytes  # window contents, oldest byte first
+
+
+@dataclass
+class CheckpointIndex:
+    config: LzssConfig
+    interval: int  # bytes of output between checkpoints
+    output_size: int  # bytes
+    checkpoints: list[Checkpoint]
+
+    def save(self, index_file: BinaryIO) -> int:
+        '''
+        Writes the index as a side-car file.
+        :return: Number of bytes written.
+        '''
+        written = index_file.write(struct.pack(
+            INDEX_HEADER_FORMAT, INDEX_MAGIC, INDEX_VERSION, *pack_config(self.config),
+            self.interval, self.output_size, len(self.checkpoints)))
+        if self.config.dictionary_id:
+            written += index_file.write(struct.pack(DICTIONARY_ID_FORMAT, self.config.dictionary_id))
+        for checkpoint in self.checkpoints:
+            written += index_file.write(struct.pack(CHECKPOINT_FORMAT, checkpoint.input_bit_offset, checkpoint.output_position))
+            written += index_file.write(checkpoint.window)
+        return written
+
+    @classmethod
+    def load(cls, index_file: BinaryIO) -> 'CheckpointIndex':
+        header = index_file.read(INDEX_HEADER_SIZE)
+        assert len(header) == INDEX_HEADER_SIZE, f'Index header truncated: expected {INDEX_HEADER_SIZE} bytes, got {len(header)}'
+        magic, version, *fields = struct.unpack(INDEX_HEADER_FORMAT, header)
+        assert magic == INDEX_MAGIC, f'Not a checkpoint index: expected magic {INDEX_MAGIC}, got {magic}'
+        assert version == INDEX_VERSION, f'Unsupported index version: expected {INDEX_VERSION}, got {version}'
+        config = unpack_config(*fields[:-3])
+        interval, output_size, checkpoint_count = fields[-3:]
+        if fields[-4] & OPTION_PRESET_DICTIONARY:
+            dictionary_id = index_file.read(DICTIONARY_ID_SIZE)
+            assert len(dictionary_id) == DICTIONARY_ID_SIZE, 'Index header truncated: dictionary ID missing'
+            config.dictionary_id, = struct.unpack(DICTIONARY_ID_FORMAT, dictionary_id)
+        checkpoints = []
+        for _ in range(checkpoint_count):
+            input_bit_offset, output_position = struct.unpack(CHECKPOINT_FORMAT, index_file.read(CHECKPOINT_SIZE))
+            window = index_file.read(config.window_size)
+            assert len(window) == config.window_size, f'Checkpoint at output position {output_position} truncated'
+            checkpoints.append(Checkpoint(input_bit_offset, output_position, window))
+        return cls(config, interval, output_size, checkpoints)
+
+
+def build_index(input_file: BinaryIO, config: LzssConfig, interval: int = DEFAULT_CHECKPOINT_INTERVAL, output_file: BinaryIO | None = None) -> CheckpointIndex:
+    '''
+    Decodes the whole stream once, taking a checkpoint at the first code word boundary after every `interval` output bytes.
+    Denser indexes seek faster, but every checkpoint stores a copy of the window.
+    :param input_file: Raw stream.
+    :param config: Decoder configuration.
+    :param interval: Output bytes between checkpoints.
+    :param output_file: Optional target for the decoded stream.
+    :return: Checkpoint index.
+    '''
+    reader = BitReader()
+    reader.add_bytes(input_file.read(BYTES_TO_PARSE_AT_ONCE))
+    window = start_window(reader, config, output_file)
+    # no code word decodes more bytes than this, so a batch of (bytes left to the next checkpoint) // max_length code words cannot pass it
+    max_length = max(min((1 << config.length_width) - 1 + config.length_bias, config.window_size), 1)
+
+    checkpoints = []
+    next_checkpoint = interval
+    for count in code_word_batches(reader, lambda: reader.add_bytes(input_file.read(BYTES_TO_PARSE_AT_ONCE)), config):
+        if window.output_position >= next_checkpoint:
+            input_bit_offset = reader.total_bytes_removed * BITS_IN_BYTE + reader.offset
+            checkpoints.append(Checkpoint(input_bit_offset, window.output_position, window.contents()))
+            next_checkpoint = window.output_position + interval
+        decode_code_words(reader, window, config, min(count, max((next_checkpoint - window.output_position) // max_length, 1)))
+    window.flush()
+    return CheckpointIndex(config, interval, window.output_position, checkpoints)
+
+
+def decode_range(input_file: BinaryIO, index: CheckpointIndex, start: int, length: int) -> bytes:
+    '''
+    Decodes `length` bytes starting at output position `start`, beginning at the nearest preceding checkpoint.
+    :param input_file: Seekable raw stream the index was built from.
+    :param index: Checkpoint index.
+    :param start: First output byte (inclusive).
+    :param length: Number of bytes; the range is clipped to the end of the stream.
+    :return: Decoded bytes.
+    '''
+    assert 0 <= start and 0 <= length, f'Invalid range: start {start}, length {length}'
+    end = min(start + length, index.output_size)
+    position = bisect_right([checkpoint.output_position for checkpoint in index.checkpoints], start) - 1
+    config = LzssConfig(**vars(index.config))
+    if position < 0:
+        input_file.seek(0)
+        decoder = LzssDecoder(config)
+        output_position = 0
+    else:
+        checkpoint = index.checkpoints[position]
+        input_file.seek(checkpoint.input_bit_offset // BITS_IN_BYTE)
+        decoder = LzssDecoder.resume(config, checkpoint.window, checkpoint.input_bit_offset, checkpoint.output_position)
+        output_position = checkpoint.output_position
+
+    decoded = bytearray()
+    while output_position + len(decoded) < end:
+        read_bytes = input_file.read(BYTES_TO_PARSE_AT_ONCE)
+        if not read_bytes:
+            decoded += decoder.flush()
+            break
+        decoded += decoder.feed(read_bytes)
+    return bytes(decoded[(start - output_position):(end - output_position)])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LZSS random access decoding')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    index_parser = subparsers.add_parser('index', help='Build a checkpoint index for a raw stream')
+    index_parser.add_argument('input_file', type=argparse.FileType('rb'), help='Input file (raw stream)')
+    index_parser.add_argument('index_file', type=argparse.FileType('wb'), help='Index file (target)')
+    index_parser.add_argument('--interval', type=int, default=DEFAULT_CHECKPOINT_INTERVAL, help='Output bytes between checkpoints')
+    add_config_arguments(index_parser)
+    range_parser = subparsers.add_parser('range', help='Decode a range of output bytes using a checkpoint index')
+    range_parser.add_argument('input_file', type=argparse.FileType('rb'), help='Input file (raw stream)')
+    range_parser.add_argument('index_file', type=argparse.FileType('rb'), help='Index file')
+    range_parser.add_argument('start', type=int, help='First output byte')
+    range_parser.add_argument('length', type=int, help='Number of output bytes')
+    args = parser.parse_args()
+
+    if args.command == 'index':
+        build_index(args.input_file, config_from_args(args), args.interval).save(args.index_file)
+    else:
+        sys.stdout.buffer.write(decode_range(args.input_file, CheckpointIndex.load(args.index_file), args.start, args.length))
@@ -0,0 +1,163 @@
+import argparse
+import compileall
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+DECODER_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLE = os.path.join(DECODER_DIR, 'examples', 'abcde.lzss')
+# the configuration of benchmark.EXAMPLES_CONFIG, which is not imported here to keep this script's own startup out of the way
+EXAMPLE_FLAGS = ['-w', '4096', '-l', '4', '-b', '3', '--invert-flag']
+HISTOGRAM_SAMPLE = '../data/txt/simple/255.pgm'  # relative to histogram.py
+DICTIONARY_SAMPLE = os.path.join(DECODER_DIR, '..', 'data', 'txt', 'lorem-ipsum.pgm')
+DICTIONARY_INPUT = os.path.join(DECODER_DIR, 'examples', 'source.txt')
+DEFAULT_MAX_REGRESSION = 1.5
+BARE_INTERPRETER = ['-c', 'pass']
+# fixed limits of the wall time of each case, in multiples of that of the bare interpreter, so that slower startup is caught
+# without a previous run to compare with; the raw stream limit is what the decoder took (Python 3.11 on Linux)
+# before framed containers, dictionaries and the compiled kernel were added
+REFERENCE_WALL_RATIOS = {
+    'import decoder': 4.0,
+    'import container': 4.5,
+    'decode raw stream': 4.3,
+    'decode container': 5.0,
+    'decode dict container': 4.5,
+    'decoder.py raw stream': 6.0,
+}
+
+
+def cases(container_path: str, dictionary_container_path: str, dictionary_path: str) -> dict[str, tuple[list[str], list[str]]]:
+    '''
+    :return: Command line of every measured case (arguments of the interpreter) and the modules it must not import.
+    '''
+    # the directory runs __main__.py, which imports decoder.py from its bytecode
+    decoder_entry = DECODER_DIR
+    decoder_script = os.path.join(DECODER_DIR, 'decoder.py')
+    histogram_script = os.path.join(DECODER_DIR, 'histogram.py')
+    # the dictionary is found through the search path, the way a decoding service would find it
+    decode_dictionary_container = (
+        f'import os; os.environ["LZSS_DICTIONARY_PATH"] = {dictionary_path!r}; import container; '
+        f'container.decode_container(open({dictionary_container_path!r}, "rb"), open(os.devnull, "wb"))')
+    return {
+        'import decoder': (['-c', 'import decoder'], ['numpy', 'argparse', 'json', 'concurrent.futures']),
+        'import container': (['-c', 'import container'], ['numpy', 'argparse', 'json', 'concurrent.futures']),
+        'decode raw stream': ([decoder_entry, *EXAMPLE_FLAGS, EXAMPLE, os.devnull], ['numpy', 'json', 'concurrent.futures', 'container']),
+        'decode container': ([decoder_entry, container_path, os.devnull], ['numpy', 'json', 'concurrent.futures']),
+        # run as a script, the module must not be imported (run) a second time by the modules it loads
+        'decoder.py raw stream': ([decoder_script, *EXAMPLE_FLAGS, EXAMPLE, os.devnull], ['numpy', 'json', 'concurrent.futures', 'container', 'decoder']),
+        'decode dict container': (['-c', decode_dictionary_container], ['numpy', 'argparse', 'json', 'concurrent.futures']),
+        'import histogram': (['-c', 'import histogram'], ['matplotlib', 'argparse', 'concurrent.futures']),
+        'histogram --no-plot': ([histogram_script, '--no-plot', '--no-cache', '--workers', '1', HISTOGRAM_SAMPLE], ['matplotlib', 'concurrent.futures']),
+    }
+
+
+def parse_importtime(report: str) -> list[tuple[int, int, str]]:
+    '''
+    Parses the `-X importtime` report written to stderr.
+    :return: Self and cumulative time (in microseconds) and name of every import; nested imports are indented by two spaces per level.
+    '''
+    entries = []
+    for line in report.splitlines():
+        if line.startswith('import time:'):
+            self_time, cumulative_time, name = line[len('import time:'):].split('|')
+            # the column titles are the first line
+            if self_time.strip().isdigit():
+                entries.append((int(self_time), int(cumulative_time), name[1:]))
+    return entries
+
+
+def wall_time(arguments: list[str]) -> float:
+    '''
+    :return: Seconds taken by one run of the interpreter with `arguments`.
+    '''
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *arguments], cwd=DECODER_DIR, capture_output=True)
+    return time.perf_counter() - start
+
+
+def measure(arguments: list[str], repeat: int) -> dict:
+    '''
+    Runs the interpreter with `arguments` `repeat` times under `-X importtime`, and as many times without it,
+    each time after a bare interpreter run, which takes the same share of a loaded machine.
+    :return: Result record with the fastest wall (without the report, which slows imports down) and import times (in seconds),
+        the wall time in multiples of that of the bare interpreter and the modules imported by the last run.
+    '''
+    best_bare = best_wall = best_import = float('inf')
+    for _ in range(repeat):
+        best_bare = min(best_bare, wall_time(BARE_INTERPRETER))
+        best_wall = min(best_wall, wall_time(arguments))
+        process = subprocess.run([sys.executable, '-X', 'importtime', *arguments], cwd=DECODER_DIR, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f'{" ".join(arguments)} failed: {process.stderr.strip().splitlines()[-1]}')
+        entries = parse_importtime(process.stderr)
+        best_import = min(best_import, sum(self_time for self_time, _, _ in entries) / 1e6)
+    top_level = [(name, cumulative_time) for _, cumulative_time, name in entries if not name.startswith(' ')]
+    return {
+        'wall_seconds': best_wall,
+        'wall_ratio': best_wall / best_bare,
+        'import_seconds': best_import,
+        'slowest_imports': sorted(top_level, key=lambda item: item[1], reverse=True)[:5],
+        'modules': sorted({name.strip() for _, _, name in entries}),
+    }
+
+
+def forbidden_imports(modules: list[str], forbidden: list[str]) -> list[str]:
+    return sorted({name for name in forbidden for module in modules if module == name or module.startswith(name + '.')})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Startup time of the decoder and histogram entry points, measured with -X importtime')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case, the fastest one is reported')
+    parser.add_argument('--json', type=argparse.FileType('w'), default=None, help='Write results as JSON')
+    parser.add_argument('--compare', type=argparse.FileType('r'), default=None, help='JSON output of a previous run to compare against')
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION, help='Fail when a case imports this many times slower than in --compare')
+    args = parser.parse_args()
+
+    # bytecode may not have been written yet (e.g. with PYTHONDONTWRITEBYTECODE), compiling the modules would be measured instead
+    compileall.compile_dir(DECODER_DIR, maxlevels=0, quiet=1)
+    failures = []
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        container_path = os.path.join(work_dir, 'abcde.lzsf')
+        subprocess.run([sys.executable, os.path.join(DECODER_DIR, 'container.py'), 'wrap', *EXAMPLE_FLAGS, EXAMPLE, container_path], check=True)
+        dictionary_path = os.path.join(work_dir, 'sample.lzsd')
+        dictionary_container_path = os.path.join(work_dir, 'source.lzsf')
+        subprocess.run([sys.executable, os.path.join(DECODER_DIR, 'dictionary.py'), 'train', *EXAMPLE_FLAGS, DICTIONARY_SAMPLE, '--output', dictionary_path], check=True, stderr=subprocess.DEVNULL)
+        subprocess.run([sys.executable, os.path.join(DECODER_DIR, 'encoder.py'), *EXAMPLE_FLAGS, '--dictionary', dictionary_path, '--block-size', '65536', DICTIONARY_INPUT, dictionary_container_path], check=True, stderr=subprocess.DEVNULL)
+        for name, (arguments, forbidden) in cases(container_path, dictionary_container_path, dictionary_path).items():
+            try:
+                result = measure(arguments, args.repeat)
+            except RuntimeError as error:
+                failures.append(str(error))
+                continue
+            results[name] = result
+            unexpected = forbidden_imports(result['modules'], forbidden)
+            slowest = ', '.join(f'{module} {seconds / 1e3:.1f}' for module, seconds in result['slowest_imports'])
+            print(f'{name:<22} wall {result["wall_seconds"] * 1e3:7.1f} ms  imports {result["import_seconds"] * 1e3:6.1f} ms  ({len(result["modules"])} modules; slowest, ms: {slowest})')
+            if unexpected:
+                failures.append(f'{name} imports {", ".join(unexpected)}')
+
+    for name, limit in REFERENCE_WALL_RATIOS.items():
+        if name in results:
+            ratio = results[name]['wall_ratio']
+            print(f'{name:<22} wall {ratio:5.2f}x the bare interpreter (limit {limit:.2f}x)')
+            if ratio > limit:
+                failures.append(f'{name} starts {ratio:.2f}x slower than the bare interpreter, the limit is {limit:.2f}x')
+    if args.json is not None:
+        json.dump({'python': platform.python_version(), 'results': results}, args.json, indent=2)
+    if args.compare is not None:
+        baseline = json.load(args.compare)['results']
+        for name, result in results.items():
+            if name in baseline:
+                ratio = result['import_seconds'] / max(baseline[name]['import_seconds'], 1e-9)
+                print(f'{name:<22} imports {ratio:5.2f}x the baseline')
+                if ratio > args.max_regression:
+                    failures.append(f'{name} imports {ratio:.2f}x slower than the baseline')
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(f'{len(failures)} startup checks failed')
@@ -0,0 +1,102 @@
+import io
+import mmap
+import os
+
+import pytest
+
+from container import CorruptBlockError, decode_container, read_header, verify_container, write_container
+from decoder import LzssConfig, decode_buffer
+from encoder import encode_blocks
+from mapped import decode_map
+
+DECODER_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = os.path.join(DECODER_DIR, '..', 'data', 'txt', 'pan-tadeusz.pgm')
+SAMPLE_SIZE = 12288
+BLOCK_SIZE = 4096
+CONFIG = LzssConfig(1024, 5, 2)
+# the middle block is corrupted, so blocks are decoded both before and after it
+CORRUPT_BLOCK = 1
+
+
+def sample() -> bytes:
+    with open(DATA_FILE, 'rb') as data_file:
+        return data_file.read(SAMPLE_SIZE)
+
+
+def make_container(checksums: bool) -> bytes:
+    output = io.BytesIO()
+    write_container(output, LzssConfig(**vars(CONFIG)), encode_blocks(sample(), LzssConfig(**vars(CONFIG)), BLOCK_SIZE), checksums)
+    return output.getvalue()
+
+
+def decoded_size(payload: bytes) -> int | None:
+    '''
+    :return: Size of `payload` decoded as a raw stream, or None when it is not a valid stream.
+    '''
+    output = io.BytesIO()
+    try:
+        decode_buffer(payload, output, LzssConfig(**vars(CONFIG)))
+    except AssertionError:
+        return None
+    return len(output.getvalue())
+
+
+def corrupt(container: bytes, checksums: bool) -> tuple[bytes, int]:
+    '''
+    Flips a byte of the corrupt block. Without checksums only its decoded size gives the block away,
+    so the first byte whose flip changes that size (and keeps the stream valid) is chosen.
+    :return: Corrupted container and the offset of the corrupt block.
+    '''
+    _, blocks = read_header(io.BytesIO(container))
+    block = blocks[CORRUPT_BLOCK]
+    payload = container[block.offset:(block.offset + block.compressed_size)]
+    for position in range(block.compressed_size // 2, block.compressed_size):
+        flipped = payload[:position] + bytes([payload[position] ^ 0x80]) + payload[(position + 1):]
+        if checksums or decoded_size(flipped) not in (None, block.decoded_size):
+            break
+    else:
+        pytest.fail('no byte of the block changes its decoded size')
+    return container[:block.offset] + flipped + container[(block.offset + block.compressed_size):], block.offset
+
+
+def decode_file(path: str, workers: int):
+    with open(path, 'rb') as input_file:
+        decode_container(input_file, io.BytesIO(), workers)
+
+
+def verify_file(path: str):
+    with open(path, 'rb') as input_file:
+        verify_container(input_file)
+
+
+def decode_mapped_file(path: str):
+    with open(path, 'rb') as input_file, mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as input_map:
+        decode_map(input_map, io.BytesIO(), LzssConfig(**vars(CONFIG)))
+
+
+DECODERS = {
+    'decode_container': lambda path: decode_file(path, 1),
+    # the error is raised in a worker process and pickled back
+    'decode_container-workers2': lambda path: decode_file(path, 2),
+    'verify_container': verify_file,
+    'decode_map': decode_mapped_file,
+}
+
+
+@pytest.mark.parametrize('checksums', [True, False], ids=['version2', 'version1'])
+def test_intact(checksums: bool):
+    output = io.BytesIO()
+    assert decode_container(io.BytesIO(make_container(checksums)), output) == SAMPLE_SIZE
+    assert output.getvalue() == sample()
+
+
+@pytest.mark.parametrize('name', DECODERS)
+@pytest.mark.parametrize('checksums', [True, False], ids=['version2', 'version1'])
+def test_corrupt_block(tmp_path, name: str, checksums: bool):
+    container, offset = corrupt(make_container(checksums), checksums)
+    path = tmp_path / 'corrupt.lzsf'
+    path.write_bytes(container)
+    with pytest.raises(CorruptBlockError) as error:
+        DECODERS[name](str(path))
+    assert error.value.offset == offset
+    assert f'offset {offset}' in str(error.value)
@@ -0,0 +1,25 @@
+import glob
+import os
+
+import pytest
+
+from histogram import analyze_file, stream_file
+
+DECODER_DIR = os.path.dirname(os.path.abspath(__file__))
+# paths are relative to histogram.py, like its command line arguments
+SIMPLE_FILES = sorted(os.path.relpath(path, DECODER_DIR) for path in glob.glob(os.path.join(DECODER_DIR, '..', 'data', 'txt', 'simple', '*.pgm')))
+CORPUS_FILE = os.path.join('..', 'data', 'txt', 'pan-tadeusz.pgm')
+# single samples, pairs and a prime, so chunk boundaries fall inside blocks of every order; a corpus file takes larger chunks
+SIMPLE_CHUNK_SIZES = [1, 2, 7]
+CORPUS_CHUNK_SIZES = [65521]
+# orders above 8 are counted as raw byte strings instead of packed integers
+MAX_ORDERS = [1, 3, 9]
+
+CASES = [(path, chunk_size) for path in SIMPLE_FILES for chunk_size in SIMPLE_CHUNK_SIZES] \
+    + [(CORPUS_FILE, chunk_size) for chunk_size in CORPUS_CHUNK_SIZES]
+
+
+@pytest.mark.parametrize('max_order', MAX_ORDERS)
+@pytest.mark.parametrize('path, chunk_size', CASES, ids=[f'{os.path.basename(path)}-chunk{chunk_size}' for path, chunk_size in CASES])
+def test_stream_file(path: str, chunk_size: int, max_order: int):
+    assert stream_file(path, max_order, chunk_size) == analyze_file(path, max_order)
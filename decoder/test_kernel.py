@@ -0,0 +1,124 @@
+import glob
+import io
+import os
+import random
+
+import pytest
+
+import decoder
+from benchmark import DATA_DIR, EXAMPLES_CONFIG, EXAMPLES_DIR
+from decoder import LzssConfig, decode, decode_buffer, decode_kernel, decode_kernel_with_stats, decode_python, decode_with_stats
+from encoder import BitWriter, encode
+
+pytestmark = pytest.mark.skipif(decoder._kernel is None, reason='compiled kernel not built (python decoder/build_kernel.py)')
+
+# bytes encoded from every data file
+SAMPLE_SIZE = 16384
+DATA_CONFIGS = [
+    LzssConfig(4096, 4, 3, flag_zero_means_literal=False),
+    LzssConfig(256, 8, 0, distance_from_end=True),
+    LzssConfig(1000, 6, 2, distance_width=11, flag_width=2, flag_zero_means_literal=False, distance_from_end=True),
+]
+RANDOM_CASES = 500
+# metrics counted by both decoders; timings, reads and refills differ
+STATS_FIELDS = ['literals', 'references', 'length_histogram', 'distance_histogram', 'input_bytes', 'output_bytes']
+
+# every decoder has to produce the output and the errors of `decode_python`
+DECODERS = {
+    'decode': lambda data, output_file, config: decode(io.BytesIO(data), output_file, config),
+    'decode_buffer': lambda data, output_file, config: decode_buffer(memoryview(data), output_file, config),
+    # chunk boundaries fall inside code words
+    'decode_kernel': lambda data, output_file, config: decode_kernel((data[i:(i + 7)] for i in range(0, len(data), 7)), output_file, config),
+}
+
+
+def run(decode_function, data: bytes, config: LzssConfig) -> tuple[bytes | None, str | None]:
+    '''
+    :return: Decoded bytes, or the error raised.
+    '''
+    output = io.BytesIO()
+    try:
+        decode_function(data, output, LzssConfig(**vars(config)))
+    except AssertionError as error:
+        return None, f'{type(error).__name__}: {error}'
+    return output.getvalue(), None
+
+
+def assert_identical(data: bytes, config: LzssConfig) -> tuple[bytes | None, str | None]:
+    '''
+    Decodes `data` with every decoder, checking the results against `decode_python`.
+    :return: Result of `decode_python`.
+    '''
+    expected = run(lambda data, output_file, config: decode_python(io.BytesIO(data), output_file, config), data, config)
+    for name, decode_function in DECODERS.items():
+        assert run(decode_function, data, config) == expected, name
+    return expected
+
+
+def assert_same_stats(data: bytes, config: LzssConfig):
+    '''
+    Checks the metrics counted by the kernel against those of `decode_with_stats`.
+    '''
+    def stats(decode_function) -> list | str:
+        try:
+            result = decode_function(io.BytesIO(data), io.BytesIO(), LzssConfig(**vars(config)))
+        except AssertionError as error:
+            return str(error)
+        return [getattr(result, name) for name in STATS_FIELDS]
+
+    assert stats(decode_kernel_with_stats) == stats(decode_with_stats)
+
+
+def random_config(generator: random.Random) -> LzssConfig:
+    return LzssConfig(
+        generator.choice([1, 2, 3, 5, 16, 17, 100, 256, 1000, 4096]), generator.randint(0, 9), generator.randint(-2, 4),
+        generator.choice([0, 0, 1, 3, 12, 20]), generator.randint(1, 3), generator.random() < 0.5, generator.random() < 0.5)
+
+
+def random_stream(generator: random.Random, config: LzssConfig, count: int) -> bytes:
+    '''
+    :return: `count` random code words of `config`; reference lengths can fall outside the window.
+    '''
+    decoder.code_word_widths(config)
+    writer = BitWriter()
+    for i in range(count):
+        is_literal = i == 0 or generator.random() < 0.5
+        flag = generator.randrange(1, 1 << config.flag_width) if is_literal != config.flag_zero_means_literal else 0
+        writer.write(flag, config.flag_width)
+        if is_literal:
+            writer.write(generator.randrange(256), decoder.BITS_IN_BYTE)
+        else:
+            writer.write(generator.randrange(1 << config.distance_width), config.distance_width)
+            writer.write(generator.randrange(1 << config.length_width), config.length_width)
+    return writer.getvalue()[0]
+
+
+@pytest.mark.parametrize('name', sorted(os.path.relpath(path, DATA_DIR) for path in glob.glob(os.path.join(DATA_DIR, '**', '*.pgm'), recursive=True)))
+@pytest.mark.parametrize('config', DATA_CONFIGS, ids=lambda config: f'w{config.window_size}-l{config.length_width}-b{config.length_bias}')
+def test_data_files(name: str, config: LzssConfig):
+    with open(os.path.join(DATA_DIR, name), 'rb') as data_file:
+        data = data_file.read(SAMPLE_SIZE)
+    encoded = encode(data, LzssConfig(**vars(config)))
+    assert assert_identical(encoded, config) == (data, None)
+    assert_same_stats(encoded, config)
+    # truncated streams, and the file itself read as a stream
+    assert_identical(encoded[:-1], config)
+    assert_identical(encoded[:(len(encoded) // 2)], config)
+    assert_identical(data, config)
+
+
+@pytest.mark.parametrize('name', sorted(os.path.basename(path) for path in glob.glob(os.path.join(EXAMPLES_DIR, '*.lzss'))))
+def test_examples(name: str):
+    with open(os.path.join(EXAMPLES_DIR, name), 'rb') as input_file:
+        encoded = input_file.read()
+    assert assert_identical(encoded, EXAMPLES_CONFIG) == (os.path.splitext(name)[0].encode(), None)
+
+
+@pytest.mark.parametrize('seed', range(RANDOM_CASES))
+def test_random(seed: int):
+    generator = random.Random(seed)
+    config = random_config(generator)
+    stream = random_stream(generator, config, generator.randint(1, 200))
+    assert_identical(stream, config)
+    assert_same_stats(stream, config)
+    assert_identical(generator.randbytes(generator.randint(0, 300)), config)
@@ -0,0 +1,70 @@
+import glob
+import io
+import os
+import random
+
+import pytest
+
+from decoder import LzssConfig, decode
+from encoder import encode
+
+DECODER_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(DECODER_DIR, '..', 'data')
+EXAMPLES_DIR = os.path.join(DECODER_DIR, 'examples')
+# bytes encoded from every data file, the Python encoder is too slow for whole files in every configuration
+SAMPLE_SIZE = 8192
+
+CONFIGS = [
+    LzssConfig(4096, 4, 3, flag_zero_means_literal=False),
+    LzssConfig(256, 8, 0),
+    LzssConfig(1024, 5, 2, distance_from_end=True),
+    LzssConfig(2048, 6, 1, flag_zero_means_literal=False, distance_from_end=True),
+    LzssConfig(512, 4, 0, flag_width=3),
+    LzssConfig(64, 3, 2, distance_width=9, flag_width=2, flag_zero_means_literal=False),
+    LzssConfig(1000, 7, 4, distance_width=10, distance_from_end=True),
+]
+# (chain depth, lazy level)
+SEARCH_SETTINGS = [(1, 0), (64, 2)]
+
+
+def inputs() -> dict[str, bytes]:
+    '''
+    :return: Samples of every data file, the sources of the example streams (named after their contents)
+        and seeded random inputs with repeats at every distance, by name.
+    '''
+    samples = {}
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, '**', '*.pgm'), recursive=True)):
+        with open(path, 'rb') as data_file:
+            samples[os.path.relpath(path, DATA_DIR)] = data_file.read(SAMPLE_SIZE)
+    for path in sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.lzss'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        samples[f'examples/{name}'] = name.encode()
+    with open(os.path.join(EXAMPLES_DIR, 'source.txt'), 'rb') as source_file:
+        samples['examples/source.txt'] = source_file.read()
+    generator = random.Random(7)
+    for i in range(4):
+        data = bytearray(generator.randbytes(generator.randint(1, 16)))
+        while len(data) < 4096:
+            start = generator.randrange(len(data))
+            data += data[start:(start + generator.randint(1, 300))] if generator.random() < 0.7 else generator.randbytes(generator.randint(1, 8))
+        samples[f'random/{i}'] = bytes(data)
+    return samples
+
+
+INPUTS = inputs()
+
+
+def config_id(config: LzssConfig) -> str:
+    return f'w{config.window_size}-l{config.length_width}-b{config.length_bias}-d{config.distance_width}-f{config.flag_width}' \
+        + ('' if config.flag_zero_means_literal else '-invert') + ('-back' if config.distance_from_end else '')
+
+
+@pytest.mark.parametrize('chain_depth, lazy_level', SEARCH_SETTINGS, ids=[f'chain{c}-lazy{l}' for c, l in SEARCH_SETTINGS])
+@pytest.mark.parametrize('config', CONFIGS, ids=config_id)
+@pytest.mark.parametrize('name', INPUTS)
+def test_roundtrip(name: str, config: LzssConfig, chain_depth: int, lazy_level: int):
+    data = INPUTS[name]
+    encoded = encode(data, LzssConfig(**vars(config)), chain_depth, lazy_level)
+    output = io.BytesIO()
+    decode(io.BytesIO(encoded), output, LzssConfig(**vars(config)))
+    assert output.getvalue() == data
@@ -0,0 +1,66 @@
+import io
+import os
+import random
+
+import pytest
+
+from decoder import LzssConfig
+from dictionary import register_dictionary
+from encoder import encode
+from seekable import CheckpointIndex, build_index, decode_range
+
+DECODER_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = os.path.join(DECODER_DIR, '..', 'data', 'txt', 'dickens.pgm')
+SAMPLE_SIZE = 8192
+# the preset dictionary is taken from the same file, right after the sample
+DICTIONARY_SIZE = 2048
+
+CONFIGS = {
+    'plain': LzssConfig(1024, 5, 2),
+    'distance-from-end': LzssConfig(256, 8, 0, flag_zero_means_literal=False, distance_from_end=True),
+    'dictionary': LzssConfig(1024, 5, 2),
+}
+# a checkpoint after every code word (an interval smaller than one reference), a few per window and a single one
+INTERVALS = [1, 97, 4096]
+RANGES = 50
+
+
+def sample() -> tuple[bytes, bytes]:
+    '''
+    :return: Data to encode and the contents of the preset dictionary.
+    '''
+    with open(DATA_FILE, 'rb') as data_file:
+        data = data_file.read(SAMPLE_SIZE + DICTIONARY_SIZE)
+    return data[:SAMPLE_SIZE], data[SAMPLE_SIZE:]
+
+
+def ranges(generator: random.Random, size: int) -> list[tuple[int, int]]:
+    '''
+    :return: Random (start, length) pairs, including empty ranges and ranges running past the end.
+    '''
+    edges = [(0, 0), (0, size), (size - 1, 1), (size, 10), (size // 2, size)]
+    return edges + [(generator.randrange(size + 1), generator.randint(0, 600)) for _ in range(RANGES)]
+
+
+@pytest.mark.parametrize('interval', INTERVALS)
+@pytest.mark.parametrize('name', CONFIGS)
+def test_decode_range(name: str, interval: int):
+    data, dictionary = sample()
+    config = LzssConfig(**vars(CONFIGS[name]))
+    if name == 'dictionary':
+        config.dictionary_id = register_dictionary(dictionary)
+    encoded = encode(data, LzssConfig(**vars(config)))
+
+    decoded = io.BytesIO()
+    index = build_index(io.BytesIO(encoded), LzssConfig(**vars(config)), interval, decoded)
+    assert decoded.getvalue() == data
+    assert index.output_size == len(data)
+    # the index is used as read back from its file
+    index_file = io.BytesIO()
+    index.save(index_file)
+    index_file.seek(0)
+    index = CheckpointIndex.load(index_file)
+    assert index.config.dictionary_id == config.dictionary_id
+
+    for start, length in ranges(random.Random(interval), len(data)):
+        assert decode_range(io.BytesIO(encoded), index, start, length) == data[start:(start + length)], (start, length)
@@ -0,0 +1,237 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+import os
+import sys
+from typing import BinaryIO
+
+import numpy as np
+
+from benchmark import MAX_WIDTH, MIN_WIDTH, grid
+from container import write_container
+from decoder import BITS_IN_BYTE, LzssConfig, code_word_widths
+from encoder import DEFAULT_CHAIN_DEPTH, DEFAULT_LAZY_LEVEL, encode, encode_blocks, match_length, min_match_length
+from histogram import calculate_entropy
+
+DEFAULT_SLICE_SIZE = 1 << 15
+DEFAULT_SLICE_COUNT = 2
+DEFAULT_LENGTH_BIASES = [0, 1, 2, 3]
+DEFAULT_TRIALS = 3
+HASH_BYTES = 2
+# the sample is searched with no length limit, so matches are compared in larger steps than by the encoder
+BYTES_TO_COMPARE_AT_ONCE = 64
+
+
+@dataclass
+class Candidate:
+    config: LzssConfig
+    predicted_size: int  # bytes, for the whole input
+    encoded_size: int | None = None  # bytes, for the whole input, from a trial encode of the sample
+
+
+def read_sample(input_file: BinaryIO, slice_size: int = DEFAULT_SLICE_SIZE, slice_count: int = DEFAULT_SLICE_COUNT) -> tuple[list[bytes], int]:
+    '''
+    Reads `slice_count` evenly spaced slices of `slice_size` bytes; small inputs are read whole.
+    :param input_file: Seekable source.
+    :return: Slices and the size of the whole input (in bytes).
+    '''
+    input_size = input_file.seek(0, os.SEEK_END)
+    if input_size <= slice_size * slice_count:
+        input_file.seek(0)
+        return [input_file.read()], input_size
+    step = (input_size - slice_size) // (slice_count - 1) if slice_count > 1 else 0
+    slices = []
+    for i in range(slice_count):
+        input_file.seek(i * step)
+        slices.append(input_file.read(slice_size))
+    return slices, input_size
+
+
+def longest_matches(data: bytes, max_distance_width: int = MAX_WIDTH, max_length: int = 1 << MAX_WIDTH, chain_depth: int = DEFAULT_CHAIN_DEPTH) -> np.ndarray:
+    '''
+    Finds the longest match at every position of `data`, separately for every window size up to `2 ** max_distance_width`.
+    Whether a match fits a window only depends on how far back it starts, so one hash chain walk, from the nearest
+    candidate to the farthest one, covers every window size at once.
+    :param max_length: Longest match worth measuring.
+    :return: Array of shape (max_distance_width + 1, len(data)): row `d` holds the longest match with a window of `2 ** d` bytes.
+    '''
+    max_back_distance = 1 << max_distance_width
+    best = np.zeros((max_distance_width + 1, len(data)), dtype=np.int64)
+    head = {}
+    previous = [-1] * len(data)
+    for position in range(len(data) - HASH_BYTES + 1):
+        key = data[position:(position + HASH_BYTES)]
+        candidate = head.get(key, -1)
+        previous[position] = candidate
+        head[key] = position
+        best_length = 0
+        depth = chain_depth
+        while candidate >= 0 and position - candidate <= max_back_distance and depth > 0:
+            depth -= 1
+            back_distance = position - candidate
+            # references never read past the newest byte of the window
+            limit = min(max_length, back_distance, len(data) - position)
+            if limit > best_length and data[candidate + best_length] == data[position + best_length]:
+                length = match_length(data, candidate, position, limit, BYTES_TO_COMPARE_AT_ONCE)
+                if length > best_length:
+                    best_length = length
+                    best[(back_distance - 1).bit_length(), position] = length
+                    if length == max_length:
+                        break
+            candidate = previous[candidate]
+    return np.maximum.accumulate(best, axis=0)
+
+
+def next_matches(best: np.ndarray, min_length: int) -> np.ndarray:
+    '''
+    :return: For every position, the first position at or after it with a match of at least `min_length` bytes (or the end).
+    '''
+    positions = np.where(best >= min_length, np.arange(len(best)), len(best))
+    return np.minimum.accumulate(positions[::-1])[::-1]
+
+
+def parse_size(best: list[int], next_match: list[int], config: LzssConfig, lengths: list[int] | None = None) -> int:
+    '''
+    Greedy parse of a sample with precomputed matches, the way `encode` parses it without lazy matching.
+    :param best: Longest match at every position, for the window size of `config`.
+    :param next_match: Output of `next_matches` for the same matches and `min_match_length(config)`.
+    :param lengths: Optional list collecting the length of every reference.
+    :return: Encoded size (in bits).
+    '''
+    _, _, literal_code_word_width, reference_code_word_width = code_word_widths(config)
+    max_length = min((1 << config.length_width) - 1 + config.length_bias, config.window_size)
+    end = len(best)
+    bits = 0
+    position = 0
+    while position < end:
+        match = next_match[position]
+        bits += (match - position) * literal_code_word_width
+        if match >= end:
+            break
+        length = min(best[match], max_length)
+        if lengths is not None:
+            lengths.append(length)
+        bits += reference_code_word_width
+        position = match + length
+    return bits
+
+
+def candidate_configs(distance_widths: list[int], length_widths: list[int] | None, length_biases: list[int]) -> list[LzssConfig]:
+    return [
+        LzssConfig(2 ** distance_width, length_width, length_bias, distance_width)
+        for distance_width, length_width in grid(distance_widths, length_widths)
+        for length_bias in length_biases
+    ]
+
+
+def predict(slices: list[bytes], input_size: int, configs: list[LzssConfig], chain_depth: int = DEFAULT_CHAIN_DEPTH) -> list[Candidate]:
+    '''
+    Predicts the encoded size of the whole input for every configuration, from greedy parses of the sample.
+    :param slices: Sample of the input, see `read_sample`.
+    :param input_size: Size of the whole input (in bytes).
+    :return: Candidates, smallest predicted size first.
+    '''
+    max_distance_width = max(config.distance_width for config in configs)
+    max_length = max((1 << config.length_width) - 1 + config.length_bias for config in configs)
+    sample_size = sum(len(data) for data in slices)
+    bits = [0] * len(configs)
+    for data in slices:
+        best = longest_matches(data, max_distance_width, max_length, chain_depth)
+        rows = {}
+        next_match_rows = {}
+        for i, config in enumerate(configs):
+            min_length = min_match_length(config)
+            if config.distance_width not in rows:
+                rows[config.distance_width] = best[config.distance_width].tolist()
+            if (config.distance_width, min_length) not in next_match_rows:
+                next_match_rows[config.distance_width, min_length] = next_matches(best[config.distance_width], min_length).tolist()
+            bits[i] += parse_size(rows[config.distance_width], next_match_rows[config.distance_width, min_length], config)
+    candidates = [Candidate(config, round(size / BITS_IN_BYTE * input_size / sample_size)) for config, size in zip(configs, bits)]
+    return sorted(candidates, key=lambda candidate: candidate.predicted_size)
+
+
+def trial_size(slices: list[bytes], config: LzssConfig, chain_depth: int, lazy_level: int) -> int:
+    return sum(len(encode(data, LzssConfig(**vars(config)), chain_depth, lazy_level)) for data in slices)
+
+
+def run_trials(slices: list[bytes], input_size: int, candidates: list[Candidate], chain_depth: int = DEFAULT_CHAIN_DEPTH, lazy_level: int = DEFAULT_LAZY_LEVEL, workers: int = 1) -> list[Candidate]:
+    '''
+    Encodes the sample with every candidate, recording the scaled result as `encoded_size`.
+    :param workers: Number of worker processes; 1 encodes in the current process.
+    :return: Candidates, smallest encoded size first.
+    '''
+    sample_size = sum(len(data) for data in slices)
+    arguments = (repeat(slices), [candidate.config for candidate in candidates], repeat(chain_depth), repeat(lazy_level))
+    if workers <= 1:
+        sizes = list(map(trial_size, *arguments))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            sizes = list(executor.map(trial_size, *arguments))
+    for candidate, size in zip(candidates, sizes):
+        candidate.encoded_size = round(size * input_size / sample_size)
+    return sorted(candidates, key=lambda candidate: candidate.encoded_size)
+
+
+def describe(slices: list[bytes], config: LzssConfig, chain_depth: int = DEFAULT_CHAIN_DEPTH) -> dict:
+    '''
+    Summarizes the sample as parsed with `config`: how much of it is covered by references and how
+    much information their lengths carry, next to the order-1 entropy of the bytes themselves.
+    '''
+    lengths = []
+    for data in slices:
+        best = longest_matches(data, config.distance_width, (1 << config.length_width) - 1 + config.length_bias, chain_depth)[config.distance_width]
+        parse_size(best.tolist(), next_matches(best, min_match_length(config)).tolist(), config, lengths)
+    sample = np.frombuffer(b''.join(slices), dtype=np.uint8)
+    length_counts = np.bincount(np.array(lengths, dtype=np.int64) - config.length_bias, minlength=1)
+    return {
+        'byte_entropy': calculate_entropy(np.bincount(sample, minlength=256), len(sample)),
+        'references': len(lengths),
+        'coverage': sum(lengths) / max(len(sample), 1),
+        'length_entropy': calculate_entropy(length_counts, len(lengths)) if lengths else 0.0,
+    }
+
+
+def config_flags(config: LzssConfig) -> str:
+    return f'--window-size {config.window_size} --length-width {config.length_width} --length-bias {config.length_bias}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recommends an LZSS configuration for a file')
+    parser.add_argument('input_file', type=argparse.FileType('rb'), help='Input file (to be encoded)')
+    parser.add_argument('--output', type=argparse.FileType('wb'), default=None, help='Encode the input with the recommended configuration into a framed container')
+    parser.add_argument('--block-size', type=int, default=0, help='Decoded size of container blocks (in bytes); zero means a single block')
+    parser.add_argument('--distance-widths', type=int, nargs='+', default=list(range(MIN_WIDTH, MAX_WIDTH + 1)), help='Distance widths (in bits) to consider')
+    parser.add_argument('--length-widths', type=int, nargs='+', default=None, help='Length widths (in bits) to consider; default is every width from 4 up to the distance width')
+    parser.add_argument('--length-biases', type=int, nargs='+', default=DEFAULT_LENGTH_BIASES, help='Length biases to consider')
+    parser.add_argument('--slice-size', type=int, default=DEFAULT_SLICE_SIZE, help='Size of every sampled slice (in bytes)')
+    parser.add_argument('--slice-count', type=int, default=DEFAULT_SLICE_COUNT, help='Number of slices sampled across the input')
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS, help='Number of best predicted candidates to trial encode; zero trusts the prediction')
+    parser.add_argument('--chain-depth', type=int, default=DEFAULT_CHAIN_DEPTH, help='Maximum number of match candidates compared per position')
+    parser.add_argument('--lazy-level', type=int, default=DEFAULT_LAZY_LEVEL, help='Lazy matching level of trial and final encodes')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for trial and final encodes')
+    args = parser.parse_args()
+
+    slices, input_size = read_sample(args.input_file, args.slice_size, args.slice_count)
+    assert input_size > 0, 'Cannot tune for empty input'
+    candidates = predict(slices, input_size, candidate_configs(args.distance_widths, args.length_widths, args.length_biases), args.chain_depth)
+    print(f'Sampled {sum(len(data) for data in slices)} of {input_size} bytes, {len(candidates)} candidates.', file=sys.stderr)
+    if args.trials > 0:
+        candidates[:args.trials] = run_trials(slices, input_size, candidates[:args.trials], args.chain_depth, args.lazy_level, args.workers)
+        for candidate in candidates[:args.trials]:
+            print(f'  {config_flags(candidate.config):<56} predicted {candidate.predicted_size:>10} B  trial {candidate.encoded_size:>10} B', file=sys.stderr)
+    else:
+        for candidate in candidates[:DEFAULT_TRIALS]:
+            print(f'  {config_flags(candidate.config):<56} predicted {candidate.predicted_size:>10} B', file=sys.stderr)
+
+    best = candidates[0]
+    summary = describe(slices, best.config, args.chain_depth)
+    print(
+        f'Sample: {summary["byte_entropy"]:.3f} bits per byte, {summary["references"]} references covering {summary["coverage"]:.1%}, '
+        f'{summary["length_entropy"]:.3f} bits of length information per reference (of {best.config.length_width}).', file=sys.stderr)
+    print(config_flags(best.config))
+    if args.output is not None:
+        args.input_file.seek(0)
+        data = args.input_file.read()
+        written = write_container(args.output, best.config, encode_blocks(data, best.config, args.block_size or len(data), args.chain_depth, args.lazy_level, args.workers))
+        print(f'Compressed {len(data)} bytes into {written} bytes.', file=sys.stderr)